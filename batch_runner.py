@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from langgraph.types import Command
+
+from checkpointer import get_checkpointer, release_finished_run, reset_thread
+from report_generator import builder, close_http_session, export_run_trace
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed",)
+
+_NO_INPUT = object()
+
+def job_id_for(job: dict[str, Any]) -> str:
+    job_id = job.get("job_id") or job.get("id")
+    if job_id:
+        return str(job_id)
+    payload = json.dumps({k: job.get(k) for k in ("topic", "plan_feedback", "config")}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+def load_jobs(path: str) -> list[dict[str, Any]]:
+    jobs = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if not job.get("topic"):
+                logger.warning(f"Skipping line {line_number} of {path}: no topic")
+                continue
+            job["job_id"] = job_id_for(job)
+            jobs.append(job)
+    return jobs
+
+def load_progress(path: str) -> dict[str, dict[str, Any]]:
+    progress: dict[str, dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return progress
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line behind.
+                continue
+            progress[record["job_id"]] = record
+    return progress
+
+class ResultWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    def _append(self, line: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def write(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        async with self._lock:
+            await asyncio.to_thread(self._append, line)
+
+def _has_pending_interrupt(snapshot) -> bool:
+    return any(task.interrupts for task in snapshot.tasks)
+
+async def run_job(graph, job: dict[str, Any], writer: ResultWriter, previous: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+    job_id = job["job_id"]
+    plan_feedback = list(job.get("plan_feedback") or [])
+    feedback_applied = (previous or {}).get("feedback_applied", 0)
+    thread = {"configurable": {**(job.get("config") or {}), "thread_id": job_id}}
+    started = time.monotonic()
+
+    snapshot = await graph.aget_state(thread)
+    if snapshot.values and not snapshot.next and not snapshot.values.get("final_report"):
+        # A thread that finished without a report, e.g. after a planner error left an empty plan,
+        # would finish the same way on every rerun: start it over from the topic.
+        if await reset_thread(graph, job_id):
+            logger.info(f"[{job_id}] Previous attempt finished without a final report, starting over")
+            snapshot = await graph.aget_state(thread)
+            feedback_applied = 0
+        else:
+            logger.warning(f"[{job_id}] Previous attempt finished without a final report and its checkpoints cannot be deleted")
+    await writer.write({"job_id": job_id, "topic": job["topic"], "status": "started", "feedback_applied": feedback_applied})
+
+    if not snapshot.values:
+        next_input: Any = {"topic": job["topic"]}
+    elif snapshot.next and not _has_pending_interrupt(snapshot):
+        # The thread was cut off mid-run by a crash: continue from its last checkpoint.
+        next_input = None
+    else:
+        next_input = _NO_INPUT
+
+    approved = False
+    while True:
+        if next_input is not _NO_INPUT:
+            async for event in graph.astream(next_input, thread, stream_mode="updates"):
+                logger.debug(f"[{job_id}] {event}")
+            snapshot = await graph.aget_state(thread)
+        if not snapshot.next:
+            break
+        if not _has_pending_interrupt(snapshot):
+            next_input = None
+        elif feedback_applied < len(plan_feedback):
+            next_input = Command(resume=plan_feedback[feedback_applied])
+            feedback_applied += 1
+            await writer.write({"job_id": job_id, "topic": job["topic"], "status": "feedback", "feedback_applied": feedback_applied})
+        elif not approved:
+            next_input = Command(resume=True)
+            approved = True
+        else:
+            raise RuntimeError("Graph is still waiting for feedback after the plan was approved")
+
+    final_report = snapshot.values.get("final_report")
+    record = {
+        "job_id": job_id,
+        "topic": job["topic"],
+        "status": "completed" if final_report else "failed",
+        "feedback_applied": feedback_applied,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        "final_report": final_report,
+    }
+    if final_report:
+        await release_finished_run(graph, job_id)
+    else:
+        record["error"] = "Graph finished without a final report"
+        await export_run_trace(thread)
+    await writer.write(record)
+    return record
+
+async def run_batch(input_path: str, output_path: str, concurrency: int = 4, checkpointer=None) -> list[dict[str, Any]]:
+    jobs = load_jobs(input_path)
+    progress = load_progress(output_path)
+    pending = [job for job in jobs if progress.get(job["job_id"], {}).get("status") not in TERMINAL_STATUSES]
+    logger.info(f"{len(jobs)} jobs in {input_path}, {len(jobs) - len(pending)} already completed, {len(pending)} to run")
+
+    graph = builder.compile(checkpointer=checkpointer or get_checkpointer())
+    writer = ResultWriter(output_path)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(job):
+        async with semaphore:
+            logger.info(f"Starting job {job['job_id']}: {job['topic']}")
+            try:
+                return await run_job(graph, job, writer, progress.get(job["job_id"]))
+            except Exception as e:
+                logger.error(f"Job {job['job_id']} failed: {e}")
+                await export_run_trace({"configurable": {**(job.get("config") or {}), "thread_id": job["job_id"]}})
+                record = {"job_id": job["job_id"], "topic": job["topic"], "status": "failed", "error": str(e)}
+                await writer.write(record)
+                return record
+
+    try:
+        return list(await asyncio.gather(*(run_one(job) for job in pending)))
+    finally:
+        await close_http_session()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate reports for every topic in a JSONL file without human review.")
+    parser.add_argument("input", help="JSONL file with one job per line: {\"job_id\", \"topic\", \"plan_feedback\": [...], \"config\": {...}}")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file that receives per-job status and reports")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of reports generated at once")
+    parser.add_argument("--checkpoint-db", default=None, help="SQLite checkpoint file (defaults to CHECKPOINT_DB_PATH or .cache/checkpoints.sqlite3)")
+    args = parser.parse_args()
+
+    records = asyncio.run(run_batch(args.input, args.output, args.concurrency, get_checkpointer(args.checkpoint_db)))
+    completed = sum(1 for record in records if record.get("status") == "completed")
+    print(f"{completed}/{len(records)} jobs completed; results in {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import statistics
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Command
+
+import instrumentation
+import report_generator
+from report_generator import Feedback, PlanQueries, Queries, builder
+
+logger = logging.getLogger(__name__)
+
+TOPIC = "Overview of the AI inference market with focus on Fireworks, Together.ai, Groq"
+
+_VOCABULARY = (
+    "inference latency throughput pricing hardware accelerators gpus lpus batching quantization serving "
+    "benchmarks providers customers open models fine-tuning tokens context caching speculative decoding "
+    "market share funding revenue partnerships datacenters energy efficiency reliability api developers"
+).split()
+
+def _rng(*parts: Any) -> random.Random:
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(_VOCABULARY) for _ in range(count))
+
+@dataclass
+class LatencyModel:
+    median: float
+    sigma: float = 0.5
+    failure_rate: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        return self.median * math.exp(rng.gauss(0.0, self.sigma))
+
+@dataclass
+class Scenario:
+    sections: int
+    number_of_queries: int
+    max_search_depth: int
+    search_api: str = "tavily"
+    llm_latency: float = 1.0
+    search_latency: float = 0.8
+    latency_sigma: float = 0.5
+    failure_rate: float = 0.0
+    grader_fail_rate: float = 0.5
+    results_per_query: int = 5
+    raw_content_words: int = 1500
+    url_pool: int = 200
+    batch_section_queries: bool = False
+    reuse_planner_sources: bool = False
+    seed: int = 0
+
+class FakeProviderError(Exception):
+    """Transient provider failure; the 503 status makes the scheduler retry it like a real outage."""
+    status_code = 503
+
+class FakeProvider:
+    """Deterministic latency and failure injection, plus a record of when each call was in flight."""
+
+    def __init__(self, name: str, latency: LatencyModel, seed: int):
+        self.name = name
+        self.latency = latency
+        self.seed = seed
+        self.attempts: Counter = Counter()
+        self.intervals: list[tuple[float, float]] = []
+        self.failures = 0
+
+    async def call(self, key: str) -> random.Random:
+        # Retries of the same request draw fresh latency and failure samples.
+        self.attempts[key] += 1
+        rng = _rng(self.seed, self.name, key, self.attempts[key])
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(self.latency.sample(rng))
+            if rng.random() < self.latency.failure_rate:
+                self.failures += 1
+                raise FakeProviderError(f"{self.name} unavailable (injected)")
+        finally:
+            self.intervals.append((started, time.perf_counter()))
+        return rng
+
+    def concurrency(self, wall_time: float) -> dict[str, Any]:
+        events = sorted([(start, 1) for start, _ in self.intervals] + [(end, -1) for _, end in self.intervals])
+        in_flight = peak = 0
+        for _, delta in events:
+            in_flight += delta
+            peak = max(peak, in_flight)
+        busy = sum(end - start for start, end in self.intervals)
+        return {
+            "calls": len(self.intervals),
+            "failures": self.failures,
+            "peak_concurrency": peak,
+            "mean_concurrency": round(busy / wall_time, 2) if wall_time else 0.0,
+        }
+
+def _prompt(messages) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+class FakeChatModel:
+    """Stand-in for ChatGoogleGenerativeAI: plain calls return a plan (JSON model) or a section (text model)."""
+
+    def __init__(self, provider: FakeProvider, scenario: Scenario, json_mode: bool):
+        self.provider = provider
+        self.scenario = scenario
+        self.json_mode = json_mode
+
+    def with_structured_output(self, schema):
+        return FakeStructuredModel(self, schema)
+
+    async def ainvoke(self, messages, config=None):
+        prompt = _prompt(messages)
+        rng = await self.provider.call(prompt)
+        content = self._plan() if self.json_mode else self._section(rng)
+        input_tokens = len(prompt) // 4 + 1
+        output_tokens = len(content) // 4 + 1
+        return AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
+
+    def _plan(self) -> str:
+        research_sections = max(self.scenario.sections - 2, 1)
+        sections = [{"name": "Introduction", "description": "Introduce the topic.", "research": False, "content": ""}]
+        sections += [
+            {"name": f"Topic {i}", "description": f"Research {_words(_rng(self.scenario.seed, 'section', i), 8)}.", "research": True, "content": ""}
+            for i in range(1, research_sections + 1)
+        ]
+        sections.append({"name": "Conclusion", "description": "Summarize the findings.", "research": False, "content": ""})
+        return f"```json\n{json.dumps({'sections': sections})}\n```"
+
+    def _section(self, rng: random.Random) -> str:
+        urls = [f"https://example.com/doc/{rng.randrange(self.scenario.url_pool)}" for _ in range(2)]
+        return (
+            f"## {_words(rng, 3).title()}\n\n**{_words(rng, 6).capitalize()}.** {_words(rng, 170)}.\n\n"
+            f"### Sources\n- {urls[0]}\n- {urls[1]}"
+        )
+
+class FakeStructuredModel:
+    def __init__(self, model: FakeChatModel, schema):
+        self.model = model
+        self.schema = schema
+
+    def _queries(self, rng: random.Random) -> list[dict[str, str]]:
+        # A small vocabulary makes sections overlap in their queries, as real ones do.
+        return [{"search_query": _words(rng, 4)} for _ in range(self.model.scenario.number_of_queries)]
+
+    async def ainvoke(self, messages, config=None):
+        rng = await self.model.provider.call(_prompt(messages))
+        if self.schema is Queries:
+            return Queries.model_validate({"queries": self._queries(rng)})
+        if self.schema is PlanQueries:
+            names = re.findall(r"^Section: (.+)$", _prompt(messages), re.MULTILINE)
+            return PlanQueries.model_validate({"sections": [{"section_name": name, "queries": self._queries(rng)} for name in names]})
+        if self.schema is Feedback:
+            grade = "fail" if rng.random() < self.model.scenario.grader_fail_rate else "pass"
+            return Feedback.model_validate({"grade": grade, "follow_up_queries": self._queries(rng)})
+        raise TypeError(f"No fake output for {self.schema.__name__}")
+
+class FakeTavilyClient:
+    def __init__(self, provider: FakeProvider, scenario: Scenario):
+        self.provider = provider
+        self.scenario = scenario
+
+    async def search(self, query: str, max_results: int = 5, include_raw_content: bool = True, topic: str = "general", **_):
+        rng = await self.provider.call(query)
+        results = []
+        for _ in range(min(max_results, self.scenario.results_per_query)):
+            doc_id = rng.randrange(self.scenario.url_pool)
+            # Page bodies depend only on the URL, so the same page returned for two queries is a true duplicate.
+            page_rng = _rng(self.scenario.seed, "page", doc_id)
+            results.append({
+                "title": f"Document {doc_id}",
+                "url": f"https://example.com/doc/{doc_id}",
+                "content": _words(page_rng, 60),
+                "raw_content": _words(page_rng, self.scenario.raw_content_words) if include_raw_content else None,
+                "score": round(rng.random(), 3),
+            })
+        return {"query": query, "follow_up_questions": None, "answer": None, "images": [], "results": results}
+
+    async def extract(self, urls: list[str], **_):
+        await self.provider.call(" ".join(urls))
+        pages = []
+        for url in urls:
+            doc_id = int(url.rsplit("/", 1)[-1])
+            pages.append({"url": url, "raw_content": _words(_rng(self.scenario.seed, "page", doc_id), self.scenario.raw_content_words)})
+        return {"results": pages, "failed_results": []}
+
+class FakeResponse:
+    def __init__(self, provider: FakeProvider, scenario: Scenario, query: str):
+        self.provider = provider
+        self.scenario = scenario
+        self.query = query
+        self.body = b""
+
+    async def __aenter__(self):
+        rng = await self.provider.call(self.query)
+        citations = [f"https://example.com/doc/{rng.randrange(self.scenario.url_pool)}" for _ in range(self.scenario.results_per_query)]
+        content = _words(rng, self.scenario.raw_content_words // 3)
+        self.body = json.dumps({
+            "choices": [{"message": {"content": content}}],
+            "citations": citations,
+            "usage": {"prompt_tokens": len(self.query) // 4 + 1, "completion_tokens": len(content) // 4 + 1},
+        }).encode("utf-8")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self) -> None:
+        pass
+
+    async def read(self) -> bytes:
+        return self.body
+
+class FakeHTTPSession:
+    """Answers the Perplexity chat completions endpoint; nothing else is called through the shared session."""
+
+    closed = False
+
+    def __init__(self, provider: FakeProvider, scenario: Scenario):
+        self.provider = provider
+        self.scenario = scenario
+
+    def post(self, url: str, headers: Optional[dict] = None, json: Optional[dict] = None) -> FakeResponse:
+        return FakeResponse(self.provider, self.scenario, json["messages"][-1]["content"])
+
+    async def close(self) -> None:
+        pass
+
+def critical_path(spans: list[instrumentation.Span]) -> list[dict[str, Any]]:
+    """Walk back from the last node to finish, each time to the latest node that ended before the current one started."""
+    nodes = sorted((span for span in spans if span.name.startswith("node.") and span.end is not None), key=lambda span: span.end)
+    path = []
+    current = nodes[-1] if nodes else None
+    while current is not None:
+        path.append(current)
+        predecessors = [span for span in nodes if span.end <= current.start]
+        current = predecessors[-1] if predecessors else None
+    return [
+        {"node": span.name[len("node."):], "section": span.attributes.get("section"), "seconds": round(span.duration, 3)}
+        for span in reversed(path)
+    ]
+
+async def run_scenario(scenario: Scenario, trace_dir: str, measure_memory: bool = True) -> dict[str, Any]:
+    latency = dict(sigma=scenario.latency_sigma, failure_rate=scenario.failure_rate)
+    llm = FakeProvider("gemini", LatencyModel(scenario.llm_latency, **latency), scenario.seed)
+    search = FakeProvider(scenario.search_api, LatencyModel(scenario.search_latency, **latency), scenario.seed)
+    fake_json = FakeChatModel(llm, scenario, json_mode=True)
+    fake_text = FakeChatModel(llm, scenario, json_mode=False)
+    fake_tavily = FakeTavilyClient(search, scenario)
+    fake_session = FakeHTTPSession(search, scenario)
+
+    thread_id = f"benchmark_{uuid.uuid4().hex}"
+    thread = {"configurable": {
+        "thread_id": thread_id,
+        "number_of_queries": scenario.number_of_queries,
+        "max_search_depth": scenario.max_search_depth,
+        "search_api": scenario.search_api,
+        "batch_section_queries": scenario.batch_section_queries,
+        "reuse_planner_sources": scenario.reuse_planner_sources,
+        "trace_dir": trace_dir,
+        # Synthetic reports must never land in the working tree.
+        "report_sink": "none",
+    }}
+    trace = instrumentation.get_trace(thread_id)
+    graph = builder.compile(checkpointer=MemorySaver())
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(report_generator, "get_llm_json", lambda: fake_json))
+        stack.enter_context(patch.object(report_generator, "get_llm_text", lambda: fake_text))
+        stack.enter_context(patch.object(report_generator, "get_tavily_async_client", lambda: fake_tavily))
+        stack.enter_context(patch.object(report_generator, "get_http_session", lambda: fake_session))
+        stack.enter_context(patch.dict(os.environ, {"PERPLEXITY_API_KEY": "benchmark"}))
+
+        if measure_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            async for _ in graph.astream({"topic": TOPIC}, thread, stream_mode="updates"):
+                pass
+            async for _ in graph.astream(Command(resume=True), thread, stream_mode="updates"):
+                pass
+            wall_time = time.perf_counter() - started
+            peak_memory = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        finally:
+            if measure_memory:
+                tracemalloc.stop()
+
+    snapshot = await graph.aget_state(thread)
+    path = critical_path(trace.spans)
+    path_by_node: dict[str, float] = {}
+    for step in path:
+        path_by_node[step["node"]] = round(path_by_node.get(step["node"], 0.0) + step["seconds"], 3)
+    return {
+        "scenario": asdict(scenario),
+        "wall_time_s": round(wall_time, 3),
+        "completed": bool(snapshot.values.get("final_report")),
+        "peak_memory_mb": round(peak_memory / 2**20, 2) if peak_memory is not None else None,
+        "critical_path": path,
+        "critical_path_by_node": path_by_node,
+        "providers": {provider.name: provider.concurrency(wall_time) for provider in (llm, search)},
+        "trace_totals": trace.summary()["totals"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report graph offline against synthetic LLM and search providers.")
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 8], help="Total sections in the generated plan (at least 3)")
+    parser.add_argument("--queries", type=int, nargs="+", default=[2], help="Values of number_of_queries to run")
+    parser.add_argument("--depth", type=int, nargs="+", default=[2], help="Values of max_search_depth to run")
+    parser.add_argument("--search-api", choices=["tavily", "perplexity", "local"], default="tavily",
+                        help="local searches the real local index (see local_index.py) instead of a synthetic provider")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per scenario, with different seeds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Median seconds per LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.8, help="Median seconds per search call")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of call latencies")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability that a call fails with a retryable error")
+    parser.add_argument("--grader-fail-rate", type=float, default=0.5, help="Probability that the grader asks for another search round")
+    parser.add_argument("--batch-queries", action="store_true", help="Write and search every section's first queries in one batch")
+    parser.add_argument("--reuse-planner-sources", action="store_true", help="Let planner search results shrink or skip first search rounds")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc, which slows CPU-bound steps down")
+    parser.add_argument("--output", default=os.path.join(".cache", "benchmarks", "results.json"), help="JSON file that receives every run's results")
+    args = parser.parse_args()
+
+    # Benchmarks measure the pipeline, so the on-disk caches must never answer for a provider.
+    os.environ["SEARCH_CACHE_DISABLED"] = "true"
+    os.environ["LLM_CACHE_DISABLED"] = "true"
+    logging.basicConfig(level=logging.WARNING)
+
+    output_dir = os.path.dirname(args.output) or "."
+    trace_dir = os.path.join(output_dir, "traces")
+    results = []
+    print(f"{'sections':>8} {'queries':>7} {'depth':>5} {'seed':>4} {'wall s':>8} {'llm peak':>8} {'search peak':>11} {'mem MB':>7}  critical path")
+    for sections, queries, depth, repeat in itertools.product(args.sections, args.queries, args.depth, range(args.repeats)):
+        scenario = Scenario(
+            sections=sections,
+            number_of_queries=queries,
+            max_search_depth=depth,
+            search_api=args.search_api,
+            llm_latency=args.llm_latency,
+            search_latency=args.search_latency,
+            latency_sigma=args.latency_sigma,
+            failure_rate=args.failure_rate,
+            grader_fail_rate=args.grader_fail_rate,
+            batch_section_queries=args.batch_queries,
+            reuse_planner_sources=args.reuse_planner_sources,
+            seed=args.seed + repeat,
+        )
+        # A fresh event loop per run gives each scenario its own schedulers and rate-limit budgets.
+        result = asyncio.run(run_scenario(scenario, trace_dir, measure_memory=not args.no_memory))
+        results.append(result)
+        providers = result["providers"]
+        path = " > ".join(f"{node} {seconds:.1f}s" for node, seconds in result["critical_path_by_node"].items())
+        print(
+            f"{sections:>8} {queries:>7} {depth:>5} {scenario.seed:>4} {result['wall_time_s']:>8.2f} "
+            f"{providers['gemini']['peak_concurrency']:>8} {providers[args.search_api]['peak_concurrency']:>11} "
+            f"{result['peak_memory_mb'] if result['peak_memory_mb'] is not None else '-':>7}  {path}"
+        )
+
+    if args.repeats > 1:
+        for key, group in itertools.groupby(results, key=lambda r: (r["scenario"]["sections"], r["scenario"]["number_of_queries"], r["scenario"]["max_search_depth"])):
+            print(f"sections={key[0]} queries={key[1]} depth={key[2]}: median wall time {statistics.median(r['wall_time_s'] for r in group):.2f}s")
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}, traces to {trace_dir}")
+
+if __name__ == "__main__":
+    main()
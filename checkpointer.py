@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(".cache", "checkpoints.sqlite3")
+DEFAULT_KEEP_LAST = 20
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """Durable LangGraph checkpointer backed by a local SQLite file.
+
+    Checkpoints and pending writes are serialized with the graph's serde and zlib-compressed.
+    Async methods run the blocking SQLite work in a thread so checkpointing never stalls the
+    event loop, and only the newest ``keep_last`` checkpoints of each thread namespace are kept.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH, *, keep_last: Optional[int] = DEFAULT_KEEP_LAST, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_last = keep_last
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._cursor() as cur:
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', checkpoint_id TEXT NOT NULL, "
+                "parent_checkpoint_id TEXT, type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+                "created_at REAL NOT NULL, PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+            )
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS writes ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', checkpoint_id TEXT NOT NULL, "
+                "task_id TEXT NOT NULL, task_path TEXT NOT NULL DEFAULT '', idx INTEGER NOT NULL, channel TEXT NOT NULL, "
+                "type TEXT, value BLOB, PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+            )
+
+    @contextmanager
+    def _cursor(self) -> Iterator[sqlite3.Cursor]:
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                yield cur
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+    def _dump(self, value: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        return type_, zlib.compress(data)
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        return self.serde.loads_typed((type_, zlib.decompress(data)))
+
+    def _row_to_tuple(self, cur: sqlite3.Cursor, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        cur.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        pending_writes = [(task_id, channel, self._load(w_type, value)) for task_id, channel, w_type, value in cur.fetchall()]
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            self._load(type_, checkpoint),
+            self._load(metadata_type, metadata),
+            (
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes,
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._cursor() as cur:
+            if checkpoint_id := get_checkpoint_id(config):
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            row = cur.fetchone()
+            return self._row_to_tuple(cur, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config is not None:
+            configurable = config["configurable"]
+            clauses.append("thread_id = ?")
+            params.append(str(configurable["thread_id"]))
+            if (checkpoint_ns := configurable.get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            f"FROM checkpoints {where} ORDER BY checkpoint_id DESC"
+        )
+        with self._cursor() as cur:
+            rows = cur.execute(query, params).fetchall()
+            results = []
+            for row in rows:
+                checkpoint_tuple = self._row_to_tuple(cur, row)
+                if filter and any(checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        type_, serialized_checkpoint = self._dump(checkpoint)
+        metadata_type, serialized_metadata = self._dump(metadata)
+        with self._cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "type, checkpoint, metadata_type, metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    configurable.get("checkpoint_id"),
+                    type_,
+                    serialized_checkpoint,
+                    metadata_type,
+                    serialized_metadata,
+                    time.time(),
+                ),
+            )
+            if self.keep_last:
+                self._prune_namespace(cur, thread_id, checkpoint_ns, self.keep_last)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        # Special channels (errors, interrupts, ...) overwrite; regular writes are only recorded once.
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        rows = [
+            (
+                str(configurable["thread_id"]),
+                configurable.get("checkpoint_ns", ""),
+                configurable["checkpoint_id"],
+                task_id,
+                task_path,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self._dump(value),
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        with self._cursor() as cur:
+            cur.executemany(
+                f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _prune_namespace(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str, keep_last: int) -> None:
+        cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, keep_last),
+        )
+        stale = [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in cur.fetchall()]
+        if stale:
+            cur.executemany("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale)
+            cur.executemany("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+            cur.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+
+    def delete_subgraphs(self, thread_id: str) -> None:
+        """Drop a thread's subgraph namespaces, which are only needed to resume a run that has not finished."""
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns != ''", (str(thread_id),))
+            cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns != ''", (str(thread_id),))
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete every thread whose newest checkpoint is older than ``max_age_seconds``."""
+        cutoff = time.time() - max_age_seconds
+        with self._cursor() as cur:
+            cur.execute("SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?", (cutoff,))
+            stale = cur.fetchall()
+            cur.executemany("DELETE FROM checkpoints WHERE thread_id = ?", stale)
+            cur.executemany("DELETE FROM writes WHERE thread_id = ?", stale)
+        return len(stale)
+
+    def get_next_version(self, current: Optional[str], channel: Any) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in results:
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def adelete_subgraphs(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_subgraphs, thread_id)
+
+async def release_finished_run(graph, thread_id: str) -> None:
+    """Drop the subgraph checkpoints of a run that reached its final report; the top-level state is kept."""
+    if isinstance(graph.checkpointer, SqliteCheckpointSaver):
+        await graph.checkpointer.adelete_subgraphs(thread_id)
+
+async def reset_thread(graph, thread_id: str) -> bool:
+    """Delete every checkpoint of ``thread_id`` so it can be run again from its input; ``False`` if the checkpointer cannot."""
+    delete = getattr(graph.checkpointer, "adelete_thread", None)
+    if delete is None:
+        return False
+    await delete(thread_id)
+    return True
+
+@lru_cache(maxsize=None)
+def get_checkpointer(path: Optional[str] = None) -> SqliteCheckpointSaver:
+    saver = SqliteCheckpointSaver(
+        path or os.environ.get("CHECKPOINT_DB_PATH", DEFAULT_CHECKPOINT_PATH),
+        keep_last=int(os.environ.get("CHECKPOINT_KEEP_LAST", DEFAULT_KEEP_LAST)),
+    )
+    max_age_seconds = float(os.environ.get("CHECKPOINT_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS))
+    if max_age_seconds > 0:
+        pruned = saver.prune(max_age_seconds)
+        if pruned:
+            logger.info(f"Pruned {pruned} checkpoint threads idle for more than {max_age_seconds:.0f}s")
+    return saver
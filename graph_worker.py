@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from langgraph.types import Command
+
+from checkpointer import release_finished_run
+from report_generator import close_http_session, export_run_trace
+
+logger = logging.getLogger(__name__)
+
+GRAPH_WORKER_CONCURRENCY = int(os.environ.get("GRAPH_WORKER_CONCURRENCY", 4))
+JOB_RETENTION_SECONDS = float(os.environ.get("GRAPH_WORKER_JOB_RETENTION_SECONDS", 6 * 60 * 60))
+
+FINISHED_STATUSES = ("awaiting_feedback", "completed", "failed")
+# Jobs waiting for plan review are never pruned: a person may come back to them at any time.
+PRUNABLE_STATUSES = ("completed", "failed")
+
+class Job:
+    """Progress of one graph run, written by the worker thread and read by UI threads."""
+
+    def __init__(self, thread: dict[str, Any]):
+        self.thread = thread
+        self.thread_id = thread["configurable"]["thread_id"]
+        self.status = "queued"
+        self.prompt: Optional[str] = None
+        self.final_report: Optional[str] = None
+        self.error: Optional[str] = None
+        self.sections: dict[str, str] = {}
+        self.updated_at = time.time()
+        self._run_ids: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def update(self, **values: Any) -> None:
+        with self._lock:
+            for key, value in values.items():
+                setattr(self, key, value)
+            self.updated_at = time.time()
+
+    def on_message(self, message, metadata: dict[str, Any]) -> None:
+        role = metadata.get("stream_role")
+        if role not in ("section_writer", "final_section_writer") or not message.content:
+            return
+        name = metadata.get("section", "Section")
+        with self._lock:
+            # A new writer run for the same section (revision or retry) replaces the previous draft
+            if self._run_ids.get(name) != message.id:
+                self._run_ids[name] = message.id
+                self.sections[name] = ""
+            self.sections[name] += message.content if isinstance(message.content, str) else str(message.content)
+            self.updated_at = time.time()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self.status,
+                "prompt": self.prompt,
+                "final_report": self.final_report,
+                "error": self.error,
+                "sections": dict(self.sections),
+            }
+
+class GraphWorker:
+    """Runs graph jobs from many UI sessions on one background event loop.
+
+    Jobs wait in a queue and at most ``concurrency`` of them run at once. Because every run shares the
+    loop, they also share its HTTP session and provider schedulers, so rate limits hold across sessions.
+    """
+
+    def __init__(self, graph, concurrency: int = GRAPH_WORKER_CONCURRENCY):
+        self.graph = graph
+        self.concurrency = concurrency
+        self._jobs: dict[str, Job] = {}
+        self._jobs_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._queue: Optional[asyncio.Queue] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="graph-worker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self._loop.create_task(self._consume())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _consume(self) -> None:
+        while True:
+            job, graph_input = await self._queue.get()
+            try:
+                await self._execute(job, graph_input)
+            except Exception as e:
+                logger.exception(f"Graph run for thread {job.thread_id} failed")
+                job.update(status="failed", error=str(e))
+                await export_run_trace(job.thread)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job, graph_input: Any) -> None:
+        job.update(status="running", prompt=None)
+        async for namespace, mode, chunk in self.graph.astream(
+            graph_input, job.thread, stream_mode=["updates", "messages"], subgraphs=True
+        ):
+            if mode == "messages":
+                message, metadata = chunk
+                job.on_message(message, metadata)
+                continue
+            if namespace:
+                continue
+            logger.info(f"Graph event: {chunk}")
+            if '__interrupt__' in chunk:
+                job.update(status="awaiting_feedback", prompt=chunk['__interrupt__'][0].value)
+                return
+
+        final_state = await self.graph.aget_state(job.thread)
+        report = final_state.values.get("final_report")
+        if report:
+            job.update(status="completed", final_report=report)
+            await release_finished_run(self.graph, job.thread_id)
+        else:
+            job.update(status="failed", error="Graph finished without a final report")
+            await export_run_trace(job.thread)
+
+    def _enqueue(self, job: Job, graph_input: Any) -> Job:
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (job, graph_input))
+        return job
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self._jobs_lock:
+            for thread_id in [t for t, job in self._jobs.items() if job.status in PRUNABLE_STATUSES and job.updated_at < cutoff]:
+                del self._jobs[thread_id]
+
+    def submit(self, thread: dict[str, Any], graph_input: Any) -> Job:
+        self._prune()
+        job = Job(thread)
+        with self._jobs_lock:
+            self._jobs[job.thread_id] = job
+        return self._enqueue(job, graph_input)
+
+    def resume(self, thread_id: str, value: Any, thread: Optional[dict[str, Any]] = None) -> Job:
+        """Resume an interrupted run; given its ``thread`` config, a job lost to a restart is rebuilt from its checkpoint."""
+        job = self.get_job(thread_id)
+        if job is None:
+            if thread is None:
+                raise KeyError(f"No job for thread {thread_id}")
+            job = Job(thread)
+            with self._jobs_lock:
+                self._jobs[thread_id] = job
+        job.update(status="queued", prompt=None)
+        return self._enqueue(job, Command(resume=value))
+
+    def get_job(self, thread_id: str) -> Optional[Job]:
+        with self._jobs_lock:
+            return self._jobs.get(thread_id)
+
+    def forget(self, thread_id: str) -> None:
+        with self._jobs_lock:
+            self._jobs.pop(thread_id, None)
+
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def shutdown(self, timeout: float = 10) -> None:
+        asyncio.run_coroutine_threadsafe(close_http_session(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
@@ -0,0 +1,265 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+# Traces of runs that never export (crashed, abandoned at plan review) are dropped oldest first.
+MAX_TRACES = int(_env_float("TRACE_MAX_ACTIVE", 256))
+TRACE_IDLE_SECONDS = _env_float("TRACE_IDLE_SECONDS", 24 * 60 * 60)
+
+# USD list prices used for cost estimates; override them when the model or the plan changes.
+PROVIDER_PRICES: dict[str, dict[str, float]] = {
+    "gemini": {
+        "input_per_mtok": _env_float("GEMINI_INPUT_USD_PER_MTOK", 0.10),
+        "output_per_mtok": _env_float("GEMINI_OUTPUT_USD_PER_MTOK", 0.40),
+        "per_request": 0.0,
+    },
+    "tavily": {"input_per_mtok": 0.0, "output_per_mtok": 0.0, "per_request": _env_float("TAVILY_USD_PER_SEARCH", 0.008)},
+    "perplexity": {
+        "input_per_mtok": _env_float("PERPLEXITY_INPUT_USD_PER_MTOK", 3.0),
+        "output_per_mtok": _env_float("PERPLEXITY_OUTPUT_USD_PER_MTOK", 15.0),
+        "per_request": _env_float("PERPLEXITY_USD_PER_REQUEST", 0.005),
+    },
+}
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    status: str = "ok"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        # OpenTelemetry trace ids are 16 random bytes; the run's thread id is kept as an attribute.
+        self.otel_trace_id = secrets.token_hex(16)
+        self.spans: list[Span] = []
+        self.touched_at = time.time()
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent: Optional[Span], attributes: dict[str, Any]) -> Span:
+        span = Span(
+            name=name,
+            trace_id=self.trace_id,
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attributes=dict(attributes),
+        )
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        by_name: dict[str, dict[str, Any]] = {}
+        for span in spans:
+            entry = by_name.setdefault(span.name, {"count": 0, "errors": 0, "wall_time_s": 0.0, "max_wall_time_s": 0.0})
+            entry["count"] += 1
+            entry["errors"] += span.status != "ok"
+            entry["wall_time_s"] += span.duration
+            entry["max_wall_time_s"] = max(entry["max_wall_time_s"], span.duration)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+                elif isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + int(value)
+        for entry in by_name.values():
+            for key, value in entry.items():
+                if isinstance(value, float):
+                    entry[key] = round(value, 6)
+        started = min((span.start for span in spans), default=0.0)
+        ended = max((span.start + span.duration for span in spans), default=0.0)
+        # Node spans contain their provider spans, so totals are taken over provider spans only.
+        providers = [span for span in spans if not span.name.startswith("node.")]
+        totals = {
+            key: round(sum(span.attributes.get(key, 0) for span in providers), 6)
+            for key in ("input_tokens", "output_tokens", "cost_usd", "bytes_fetched", "retries", "queue_wait_s")
+        }
+        totals["cache_hits"] = sum(1 for span in providers if span.attributes.get("cache_hit"))
+        totals["provider_calls"] = len(providers)
+        return {
+            "trace_id": self.trace_id,
+            "wall_time_s": round(ended - started, 3),
+            "spans": len(spans),
+            "totals": totals,
+            "by_name": by_name,
+        }
+
+    def to_otel(self) -> dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otel_attribute("service.name", "deep-research-agent"), _otel_attribute("thread_id", self.trace_id)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [
+                        {
+                            "traceId": self.otel_trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "startTimeUnixNano": int(span.start * 1e9),
+                            "endTimeUnixNano": int((span.start + span.duration) * 1e9),
+                            "status": {"code": 1 if span.status == "ok" else 2},
+                            "attributes": [_otel_attribute(key, value) for key, value in span.attributes.items()],
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+
+def _otel_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+_traces: "OrderedDict[str, Trace]" = OrderedDict()
+_traces_lock = threading.Lock()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def _evict_traces(now: float) -> None:
+    while _traces:
+        trace_id, trace = next(iter(_traces.items()))
+        if len(_traces) < MAX_TRACES and now - trace.touched_at < TRACE_IDLE_SECONDS:
+            break
+        del _traces[trace_id]
+        logger.warning(f"Dropping trace '{trace_id}' ({len(trace.spans)} spans) that was never exported")
+
+def get_trace(trace_id: str) -> Trace:
+    now = time.time()
+    with _traces_lock:
+        trace = _traces.get(trace_id)
+        if trace is None:
+            _evict_traces(now)
+            trace = _traces[trace_id] = Trace(trace_id)
+        _traces.move_to_end(trace_id)
+        trace.touched_at = now
+        return trace
+
+def discard_trace(trace_id: str) -> None:
+    with _traces_lock:
+        _traces.pop(trace_id, None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def record(key: str, value: Any) -> None:
+    if (span := _current_span.get()) is not None:
+        span.set(key, value)
+
+def increment(key: str, amount: float = 1) -> None:
+    if (span := _current_span.get()) is not None:
+        span.add(key, amount)
+
+def record_usage(provider: str, input_tokens: int = 0, output_tokens: int = 0, requests: int = 1) -> None:
+    prices = PROVIDER_PRICES.get(provider)
+    increment("input_tokens", input_tokens)
+    increment("output_tokens", output_tokens)
+    if prices is not None:
+        cost = requests * prices["per_request"] + (input_tokens * prices["input_per_mtok"] + output_tokens * prices["output_per_mtok"]) / 1e6
+        increment("cost_usd", cost)
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    parent = _current_span.get()
+    trace_id = trace_id or (parent.trace_id if parent else None)
+    if trace_id:
+        current = get_trace(trace_id).start_span(name, parent, attributes)
+    else:
+        # Without a thread id there is no run to attribute the span to, so it is not recorded.
+        current = Span(name, "", secrets.token_hex(8), parent.span_id if parent else None, time.time(), attributes=dict(attributes))
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        # LangGraph interrupts are control flow, not failures.
+        if type(e).__name__ not in ("GraphInterrupt", "NodeInterrupt"):
+            current.status = "error"
+            current.set("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end = time.time()
+        _current_span.reset(token)
+
+def _trace_id_from_config(config) -> Optional[str]:
+    configurable = (config or {}).get("configurable", {}) if isinstance(config, dict) else {}
+    thread_id = configurable.get("thread_id")
+    return str(thread_id) if thread_id else None
+
+def _span_attributes(state) -> dict[str, Any]:
+    section = state.get("section") if isinstance(state, dict) else None
+    return {"section": section.name} if section is not None else {}
+
+def instrument_node(func: Callable) -> Callable:
+    """Record a span for every run of a graph node, keyed on the run's thread id."""
+    accepts_config = "config" in inspect.signature(func).parameters
+
+    def call_args(state, config):
+        return (state, config) if accepts_config else (state,)
+
+    if inspect.iscoroutinefunction(func):
+        async def wrapper(state, config):
+            with span(f"node.{func.__name__}", _trace_id_from_config(config), **_span_attributes(state)):
+                return await func(*call_args(state, config))
+    else:
+        def wrapper(state, config):
+            with span(f"node.{func.__name__}", _trace_id_from_config(config), **_span_attributes(state)):
+                return func(*call_args(state, config))
+
+    functools.update_wrapper(wrapper, func)
+    # LangGraph inspects the signature to decide whether to pass config; always take it.
+    del wrapper.__wrapped__
+    return wrapper
+
+def export_trace(trace_id: str, directory: str) -> Optional[dict[str, Any]]:
+    with _traces_lock:
+        trace = _traces.pop(trace_id, None)
+    if trace is None:
+        return None
+    summary = trace.summary()
+    os.makedirs(directory, exist_ok=True)
+    safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in trace_id)
+    with open(os.path.join(directory, f"{safe_id}.trace.json"), "w") as f:
+        json.dump(trace.to_otel(), f)
+    with open(os.path.join(directory, f"{safe_id}.summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Trace for '{trace_id}' written to {directory}: {summary['wall_time_s']}s over {summary['spans']} spans")
+    return summary
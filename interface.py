@@ -1,13 +1,11 @@
 import streamlit as st
-import asyncio
 import logging
-import os
+import uuid
 from dotenv import load_dotenv
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.types import Command
-from typing import Dict, Any
 
 # Import from the renamed script
+from checkpointer import get_checkpointer
+from graph_worker import FINISHED_STATUSES, GraphWorker
 from report_generator import builder
 
 # Load environment variables
@@ -52,53 +50,46 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Custom async input handler for Streamlit
-async def get_streamlit_input(prompt: str, key: str, placeholder: str = "Your feedback here...") -> str:
+# Input handler for Streamlit
+def get_streamlit_input(prompt: str, key: str, placeholder: str = "Your feedback here...") -> str:
     st.markdown(prompt)
     feedback = st.text_area("", placeholder=placeholder, key=key, height=100, label_visibility="collapsed")
     if st.button("Submit", key=f"submit_{key}"):
         return feedback.strip() if feedback else ""
     return None
 
-# Function to run the graph asynchronously
-async def run_graph(graph_instance, input_data: Dict[str, Any], thread: Dict[str, Any]):
-    state = {"topic": input_data["topic"], "feedback_on_report_plan": None}
-    feedback_count = 0
-
-    async for event in graph_instance.astream(input_data, thread, stream_mode="updates"):
-        logger.info(f"Run graph event: {event}")
-        if '__interrupt__' in event:
-            interrupt_value = event['__interrupt__'][0].value
-            st.session_state["current_prompt"] = interrupt_value
-            st.session_state["state"] = graph_instance.get_state(thread).values
-            st.session_state["feedback_key"] = f"feedback_{feedback_count}"
-            return "awaiting_feedback"
-        elif 'compile_final_report' in event:
-            final_state = graph_instance.get_state(thread)
-            report = final_state.values.get("final_report")
-            st.session_state["final_report"] = report
-            return "completed"
-    return "running"
-
-# Function to resume graph execution with feedback
-async def resume_graph(graph_instance, thread: Dict[str, Any], feedback: str):
-    update = {"feedback_on_report_plan": feedback if feedback.lower() != "true" else "true"}
-    command = Command(resume=update if feedback.lower() != "true" else True)
-    
-    async for event in graph_instance.astream(command, thread, stream_mode="updates"):
-        logger.info(f"Resume graph event: {event}")
-        if '__interrupt__' in event:
-            interrupt_value = event['__interrupt__'][0].value
-            st.session_state["current_prompt"] = interrupt_value
-            st.session_state["state"] = graph_instance.get_state(thread).values
-            st.session_state["feedback_key"] = f"feedback_{st.session_state.get('feedback_count', 0) + 1}"
-            return "awaiting_feedback"
-        elif 'compile_final_report' in event:
-            final_state = graph_instance.get_state(thread)
-            report = final_state.values.get("final_report")
-            st.session_state["final_report"] = report
-            return "completed"
-    return "running"
+# One worker per server process, shared by every session
+@st.cache_resource
+def get_graph_worker() -> GraphWorker:
+    worker = GraphWorker(builder.compile(checkpointer=get_checkpointer()))
+    logger.info(f"Graph worker started with {worker.concurrency} concurrent runs")
+    return worker
+
+# Polls the session's job and hands control back to the app once it needs the user
+@st.fragment(run_every=1.0)
+def show_progress(worker: GraphWorker, thread_id: str):
+    job = worker.get_job(thread_id)
+    if job is None:
+        st.session_state["stage"] = "failed"
+        st.session_state["error"] = "The report job was lost, most likely because the server restarted."
+        st.rerun()
+    snapshot = job.snapshot()
+    if snapshot["status"] in FINISHED_STATUSES:
+        st.session_state["stage"] = snapshot["status"]
+        st.session_state["current_prompt"] = snapshot["prompt"]
+        st.session_state["final_report"] = snapshot["final_report"]
+        st.session_state["error"] = snapshot["error"]
+        st.rerun()
+
+    if snapshot["status"] == "queued":
+        st.info(f"Waiting for a free worker ({worker.queue_size()} job(s) queued)...")
+    else:
+        st.markdown(f"*{st.session_state['running_message']}*")
+    if snapshot["sections"]:
+        st.markdown("### Writing your report...")
+        for name, text in snapshot["sections"].items():
+            st.markdown(f"**{name}**")
+            st.markdown(text + " ▌")
 
 # Main Streamlit app
 def main():
@@ -111,73 +102,65 @@ def main():
         st.session_state["topic"] = ""
         st.session_state["current_prompt"] = ""
         st.session_state["final_report"] = ""
+        st.session_state["error"] = None
         st.session_state["feedback_count"] = 0
-        st.session_state["state"] = {}
         st.session_state["feedback_key"] = "feedback_0"
-        st.session_state["graph_instance"] = None
-        st.session_state["loop"] = asyncio.new_event_loop()
+        st.session_state["running_message"] = ""
+        # Checkpoints outlive the session, so every session needs its own thread
+        st.session_state["thread_id"] = f"streamlit_{uuid.uuid4().hex}"
 
-    # Set the event loop
-    asyncio.set_event_loop(st.session_state["loop"])
+    worker = get_graph_worker()
+    thread_id = st.session_state["thread_id"]
 
     # Thread configuration
     thread = {
         "configurable": {
-            "thread_id": "streamlit_thread",
+            "thread_id": thread_id,
             "search_api": "tavily",
             "max_search_depth": 1,
         }
     }
 
-    # Compile the graph once
-    if st.session_state["graph_instance"] is None:
-        memory = MemorySaver()
-        st.session_state["graph_instance"] = builder.compile(checkpointer=memory)
-        logger.info("Graph compiled with checkpointer")
-
-    graph_instance = st.session_state["graph_instance"]
-
     # Stage 1: Topic Input
     if st.session_state["stage"] == "input":
         topic = st.text_input("", placeholder="Enter your topic...", label_visibility="collapsed")
         if st.button("Generate Report"):
             if topic:
                 st.session_state["topic"] = topic
-                st.session_state["stage"] = "generating"
+                st.session_state["stage"] = "running"
+                st.session_state["running_message"] = "Generating your report plan..."
+                worker.submit(thread, {"topic": topic})
                 st.rerun()
             else:
                 st.error("Please enter a topic.")
 
-    # Stage 2: Generating Report Plan
-    elif st.session_state["stage"] == "generating":
-        with st.spinner("Generating your report plan..."):
-            result = st.session_state["loop"].run_until_complete(
-                run_graph(graph_instance, {"topic": st.session_state["topic"]}, thread)
-            )
-            st.session_state["stage"] = result
-            st.rerun()
+    # Stage 2: Graph running on the worker
+    elif st.session_state["stage"] == "running":
+        show_progress(worker, thread_id)
 
     # Stage 3: Awaiting Feedback
     elif st.session_state["stage"] == "awaiting_feedback":
         st.markdown("### Review Your Plan")
         st.write(st.session_state["current_prompt"])
-        
-        feedback = st.session_state["loop"].run_until_complete(
-            get_streamlit_input(
-                "Provide feedback or enter 'true' to proceed:",
-                st.session_state["feedback_key"],
-                "e.g., 'Add more details' or 'true'"
-            )
+
+        feedback = get_streamlit_input(
+            "Provide feedback or enter 'true' to proceed:",
+            st.session_state["feedback_key"],
+            "e.g., 'Add more details' or 'true'"
         )
 
         if feedback is not None:
             st.session_state["feedback_count"] += 1
-            with st.spinner("Updating your plan..."):
-                result = st.session_state["loop"].run_until_complete(
-                    resume_graph(graph_instance, thread, feedback)
-                )
-                st.session_state["stage"] = result
-                st.rerun()
+            st.session_state["feedback_key"] = f"feedback_{st.session_state['feedback_count']}"
+            approved = feedback.lower() == "true"
+            st.session_state["running_message"] = "Writing your report..." if approved else "Updating your plan..."
+            try:
+                worker.resume(thread_id, True if approved else {"feedback_on_report_plan": feedback}, thread)
+                st.session_state["stage"] = "running"
+            except KeyError:
+                st.session_state["stage"] = "failed"
+                st.session_state["error"] = "The report job was lost, most likely because the server restarted."
+            st.rerun()
 
     # Stage 4: Completed Report
     elif st.session_state["stage"] == "completed":
@@ -195,10 +178,19 @@ def main():
             )
         else:
             st.error("Failed to generate the report.")
-        
+
+        if st.button("Start Over"):
+            worker.forget(thread_id)
+            st.session_state.clear()
+            st.rerun()
+
+    # Failed run
+    elif st.session_state["stage"] == "failed":
+        st.error(f"Failed to generate the report: {st.session_state['error']}")
         if st.button("Start Over"):
+            worker.forget(thread_id)
             st.session_state.clear()
             st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
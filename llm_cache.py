@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+
+import prompts
+from sqlite_store import SqliteStore, env_store_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+EMBEDDING_DIM = 1024
+
+_WORD_RE = re.compile(r"\w+")
+
+def prompts_version() -> str:
+    templates = sorted((name, value) for name, value in vars(prompts).items() if isinstance(value, str) and not name.startswith("_"))
+    return hashlib.sha256(json.dumps(templates).encode("utf-8")).hexdigest()[:16]
+
+def embed(text: str) -> np.ndarray:
+    """Local hashed bag-of-words embedding (unigrams and bigrams), L2-normalized."""
+    words = _WORD_RE.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "big") % EMBEDDING_DIM
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class LLMCache(SqliteStore):
+    """SQLite cache of LLM outputs with an exact tier and an optional embedding-similarity tier.
+
+    Entries from an older version of the prompt templates are purged on open, and the cache is
+    bounded by a TTL and a least-recently-used entry limit.
+    """
+
+    TABLE = "llm_cache"
+    COUNTERS = ("exact_hits", "semantic_hits", "misses")
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        version: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.version = version or prompts_version()
+        self._lock = threading.Lock()
+        # namespace -> (keys, matrix of embeddings); loaded lazily and kept in sync with writes.
+        self._vectors: dict[str, tuple[list[str], np.ndarray]] = {}
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, params_key TEXT NOT NULL, value TEXT NOT NULL, "
+            "embedding BLOB, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_namespace ON llm_cache (namespace, params_key)")
+        conn.execute("CREATE TABLE IF NOT EXISTS llm_cache_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = conn.execute("SELECT value FROM llm_cache_meta WHERE name = 'prompts_version'").fetchone()
+        if row is None or row[0] != self.version:
+            if row is not None:
+                logger.info("Prompt templates changed, invalidating LLM cache")
+            conn.execute("DELETE FROM llm_cache")
+            conn.execute("INSERT OR REPLACE INTO llm_cache_meta (name, value) VALUES ('prompts_version', ?)", (self.version,))
+
+    def make_key(self, namespace: str, params: dict[str, Any], messages: list[tuple[str, str]]) -> str:
+        payload = json.dumps({"version": self.version, "namespace": namespace, "params": params, "messages": messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def params_key(params: dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                return None
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _load_vectors(self, namespace: str) -> tuple[list[str], np.ndarray]:
+        with self._lock:
+            cached = self._vectors.get(namespace)
+        if cached is not None:
+            return cached
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT key, params_key, embedding FROM llm_cache WHERE namespace = ? AND embedding IS NOT NULL", (namespace,)
+            ).fetchall()
+        keys = [f"{params_key}:{key}" for key, params_key, _ in rows]
+        matrix = np.stack([np.frombuffer(embedding, dtype=np.float32) for _, _, embedding in rows]) if rows else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        with self._lock:
+            self._vectors[namespace] = (keys, matrix)
+        return keys, matrix
+
+    def get_similar(self, namespace: str, params: dict[str, Any], text: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        keys, matrix = self._load_vectors(namespace)
+        if not keys:
+            return None
+        prefix = f"{self.params_key(params)}:"
+        scores = matrix @ embed(text)
+        for index in np.argsort(-scores):
+            if scores[index] < self.similarity_threshold:
+                break
+            if keys[index].startswith(prefix):
+                value = self.get(keys[index][len(prefix):])
+                if value is not None:
+                    logger.info(f"Semantic LLM cache hit in '{namespace}' (similarity {scores[index]:.3f})")
+                    return value
+        return None
+
+    def lookup(self, key: str, namespace: str, params: dict[str, Any], semantic_text: Optional[str] = None) -> Optional[Any]:
+        value = self.get(key)
+        if value is not None:
+            self._count("exact_hits")
+            return value
+        if semantic_text:
+            value = self.get_similar(namespace, params, semantic_text)
+            if value is not None:
+                self._count("semantic_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, namespace: str, params: dict[str, Any], value: Any, semantic_text: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        params_key = self.params_key(params)
+        vector = embed(semantic_text) if semantic_text else None
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, params_key, value, embedding, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, params_key, json.dumps(value), vector.tobytes() if vector is not None else None, now, now),
+            )
+            evicted = self._evict(conn, now)
+        with self._lock:
+            if evicted:
+                self._vectors.clear()
+            elif vector is not None and namespace in self._vectors:
+                keys, matrix = self._vectors[namespace]
+                self._vectors[namespace] = (keys + [f"{params_key}:{key}"], np.vstack([matrix, vector[None, :]]))
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        evicted = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            evicted += conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        return max(evicted, 0)
+
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        with closing(self._connect()) as conn, conn:
+            if namespace is None:
+                conn.execute("DELETE FROM llm_cache")
+            else:
+                conn.execute("DELETE FROM llm_cache WHERE namespace = ?", (namespace,))
+        with self._lock:
+            self._vectors.clear()
+
+    async def alookup(self, key: str, namespace: str, params: dict[str, Any], semantic_text: Optional[str] = None) -> Optional[Any]:
+        return await asyncio.to_thread(self.lookup, key, namespace, params, semantic_text)
+
+    async def aset(self, key: str, namespace: str, params: dict[str, Any], value: Any, semantic_text: Optional[str] = None) -> None:
+        await asyncio.to_thread(self.set, key, namespace, params, value, semantic_text)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+@lru_cache(maxsize=1)
+def get_llm_cache() -> LLMCache:
+    return LLMCache(
+        path=env_store_path("LLM_CACHE", DEFAULT_CACHE_PATH),
+        ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        similarity_threshold=float(os.environ.get("LLM_CACHE_SIMILARITY_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD)),
+    )
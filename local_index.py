@@ -0,0 +1,188 @@
+import argparse
+import html
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+from sources import normalize_url, terms
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(".cache", "local_index.sqlite3")
+INGEST_EXTENSIONS = (".md", ".markdown", ".txt", ".rst", ".html", ".htm")
+SNIPPET_TOKENS = 64
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.DOTALL | re.IGNORECASE)
+_TITLE_RE = re.compile(r"<title>(.*?)</title>", re.DOTALL | re.IGNORECASE)
+
+def _document_key(url: str) -> str:
+    return normalize_url(url) if url.startswith(("http://", "https://")) else url
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 query matching any of the query's key terms; ranking is left to BM25."""
+    query_terms = sorted(terms(query))
+    if not query_terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in query_terms)
+
+class LocalIndex:
+    """SQLite FTS5 full-text index over documents we ingest ourselves, ranked with BM25."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, title TEXT NOT NULL,
+                    content TEXT NOT NULL, added_at REAL NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                    title, content, content='documents', content_rowid='id', tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                    INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                    INSERT INTO documents_fts (documents_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                    INSERT INTO documents_fts (documents_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+                    INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+                END;
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add_many(self, documents: Iterable[dict[str, str]]) -> int:
+        now = time.time()
+        rows = [
+            (_document_key(document["url"]), document.get("title") or document["url"], document["content"], now)
+            for document in documents
+            if document.get("content")
+        ]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO documents (url, title, content, added_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET title = excluded.title, content = excluded.content, added_at = excluded.added_at "
+                "WHERE content != excluded.content OR title != excluded.title",
+                rows,
+            )
+        return len(rows)
+
+    def add(self, url: str, title: str, content: str) -> None:
+        self.add_many([{"url": url, "title": title, "content": content}])
+
+    def search(self, query: str, max_results: int = 5) -> list[dict[str, Any]]:
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT d.url, d.title, d.content, "
+                f"snippet(documents_fts, 1, '', '', ' ... ', {SNIPPET_TOKENS}), bm25(documents_fts, 2.0, 1.0) AS rank "
+                "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+                "WHERE documents_fts MATCH ? ORDER BY rank LIMIT ?",
+                (expression, max_results),
+            ).fetchall()
+        results = []
+        for url, title, content, snippet, rank in rows:
+            # bm25() is negative with better matches further below zero; map it onto (0, 1).
+            relevance = max(-rank, 0.0)
+            results.append({
+                "title": title,
+                "url": url,
+                "content": snippet,
+                "raw_content": content,
+                "score": round(relevance / (1.0 + relevance), 4),
+            })
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        with closing(self._connect()) as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM documents").fetchone()
+        return {"documents": count, "characters": size}
+
+def read_document(path: str) -> dict[str, str]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    title = os.path.splitext(os.path.basename(path))[0]
+    if path.lower().endswith((".html", ".htm")):
+        match = _TITLE_RE.search(text)
+        if match:
+            title = html.unescape(match.group(1)).strip() or title
+        text = html.unescape(_TAG_RE.sub(" ", text))
+        text = re.sub(r"[ \t]+", " ", text)
+        text = re.sub(r"\n\s*\n+", "\n\n", text)
+    else:
+        heading = next((line.lstrip("#").strip() for line in text.splitlines() if line.startswith("#")), None)
+        title = heading or title
+    return {"url": f"file://{os.path.abspath(path)}", "title": title, "content": text.strip()}
+
+def ingest_paths(index: LocalIndex, paths: Iterable[str]) -> int:
+    documents = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                documents.extend(read_document(os.path.join(root, name)) for name in sorted(files) if name.lower().endswith(INGEST_EXTENSIONS))
+        elif os.path.isfile(path):
+            documents.append(read_document(path))
+        else:
+            logger.warning(f"Skipping {path}: not a file or directory")
+    return index.add_many(documents)
+
+def ingest_search_cache(index: LocalIndex, cache_path: str) -> int:
+    """Index every page with ``raw_content`` that a web search has already fetched into the search cache."""
+    if not os.path.exists(cache_path):
+        logger.warning(f"No search cache at {cache_path}")
+        return 0
+    documents = []
+    with closing(sqlite3.connect(cache_path, timeout=30)) as conn:
+        for (value,) in conn.execute("SELECT value FROM search_cache"):
+            for result in json.loads(value).get("results", []):
+                if result.get("raw_content"):
+                    documents.append({"url": result["url"], "title": result.get("title"), "content": result["raw_content"]})
+    return index.add_many(documents)
+
+@lru_cache(maxsize=1)
+def get_local_index() -> LocalIndex:
+    return LocalIndex(os.environ.get("LOCAL_INDEX_PATH", DEFAULT_INDEX_PATH))
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local full-text index used by search_api=local.")
+    parser.add_argument("--index", default=None, help="SQLite index file (defaults to LOCAL_INDEX_PATH or .cache/local_index.sqlite3)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Add files, directories or cached search results to the index")
+    ingest.add_argument("paths", nargs="*", help=f"Files or directories to index ({', '.join(INGEST_EXTENSIONS)})")
+    ingest.add_argument("--search-cache", nargs="?", const=os.path.join(".cache", "search_cache.sqlite3"), default=None,
+                        help="Also index the raw_content of pages in the search cache")
+    search = commands.add_parser("search", help="Run a query against the index")
+    search.add_argument("query")
+    search.add_argument("--max-results", type=int, default=5)
+    commands.add_parser("stats", help="Show the number of indexed documents")
+    args = parser.parse_args()
+
+    index = LocalIndex(args.index) if args.index else get_local_index()
+    if args.command == "ingest":
+        added = ingest_paths(index, args.paths)
+        if args.search_cache:
+            added += ingest_search_cache(index, args.search_cache)
+        print(f"Indexed {added} documents; {index.stats()}")
+    elif args.command == "search":
+        for result in index.search(args.query, args.max_results):
+            print(f"{result['score']:.3f}  {result['title']}  {result['url']}\n       {result['content']}")
+    else:
+        print(index.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import logging
+from typing import Any
+
+import numpy as np
+
+from sources import count_tokens, split_passages, tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def bm25_scores(passages: list[list[str]], query: list[str], k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """BM25 score of every tokenized passage against ``query``, computed as one matrix product."""
+    vocabulary = {term: column for column, term in enumerate(dict.fromkeys(query))}
+    if not passages or not vocabulary:
+        return np.zeros(len(passages), dtype=np.float32)
+    frequencies = np.zeros((len(passages), len(vocabulary)), dtype=np.float32)
+    for row, passage in enumerate(passages):
+        for term in passage:
+            column = vocabulary.get(term)
+            if column is not None:
+                frequencies[row, column] += 1
+    lengths = np.fromiter((len(passage) for passage in passages), dtype=np.float32, count=len(passages))
+    document_frequency = (frequencies > 0).sum(axis=0)
+    idf = np.log1p((len(passages) - document_frequency + 0.5) / (document_frequency + 0.5))
+    length_norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+    return (frequencies * (k1 + 1) / (frequencies + length_norm[:, None])) @ idf
+
+def rank_sources(sources: list[dict[str, Any]], query: str, top_k: int) -> list[dict[str, Any]]:
+    """The ``top_k`` sources whose title and snippet best match ``query``; sources sharing no term with it are dropped."""
+    if not sources:
+        return []
+    scores = bm25_scores([tokens(f"{source.get('title') or ''} {source.get('content') or ''}") for source in sources], tokens(query))
+    return [sources[i] for i in np.argsort(-scores, kind="stable")[:top_k] if scores[i] > 0]
+
+def retrieve_passages(sources: list[dict[str, Any]], query: str, token_budget: int, top_k: int) -> str:
+    """The ``top_k`` passages across all sources that best match ``query``, within ``token_budget`` tokens.
+
+    Passages are grouped under their source's title and URL, in document order, so every claim the
+    writer takes from them stays attributable to a specific page.
+    """
+    candidates: list[tuple[int, int, str]] = []
+    for source_position, source in enumerate(sources):
+        text = source.get('raw_content') or source.get('content') or ''
+        candidates.extend((source_position, position, passage) for position, passage in enumerate(split_passages(text)))
+    if not candidates:
+        return ""
+
+    scores = bm25_scores([tokens(passage) for _, _, passage in candidates], tokens(query))
+    if (scores > 0).any():
+        order = [i for i in np.argsort(-scores, kind="stable") if scores[i] > 0]
+    else:
+        # Nothing matches the query: fall back to each source's lead passage.
+        order = [i for i, (_, position, _) in enumerate(candidates) if position == 0]
+
+    chosen: list[int] = []
+    used = 0
+    for i in order:
+        if len(chosen) >= top_k:
+            break
+        passage_tokens = count_tokens(candidates[i][2])
+        if used + passage_tokens > token_budget:
+            continue
+        chosen.append(int(i))
+        used += passage_tokens
+    if not chosen and order:
+        # No whole passage fits the budget: keep as much of the best one as does.
+        source_position, position, passage = candidates[order[0]]
+        prefix = truncate_tokens(passage, token_budget)
+        if prefix:
+            candidates[order[0]] = (source_position, position, prefix)
+            chosen.append(int(order[0]))
+            used = count_tokens(prefix)
+    logger.info(f"Retrieved {len(chosen)} of {len(candidates)} passages ({used} tokens) from {len(sources)} sources")
+
+    by_source: dict[int, list[tuple[int, str]]] = {}
+    for i in chosen:
+        source_position, position, passage = candidates[i]
+        by_source.setdefault(source_position, []).append((position, passage))
+    parts = ["Sources:\n\n"]
+    for source_position in sorted(by_source):
+        source = sources[source_position]
+        parts.append(f"Source {source['title']}:\n===\nURL: {source['url']}\n===\nRelevant passages:\n")
+        parts.extend(f"- {passage}\n" for _, passage in sorted(by_source[source_position]))
+        parts.append("\n")
+    return "".join(parts).strip()
@@ -88,6 +88,26 @@ Make the queries specific enough to find high-quality, relevant sources.
 </Task>
 """
 
+plan_query_writer_instructions = """You are an expert technical writer crafting targeted web search queries for every research section of a technical report at once.
+
+<Sections>
+{sections}
+</Sections>
+
+<Task>
+For each section above, generate the listed number of search queries that will help gather comprehensive information about that section's topic.
+
+The queries for each section should:
+
+1. Be related to the section topic
+2. Examine different aspects of the topic
+
+Return one entry per section, using the section name exactly as given. Where two sections need the same information, use the same query wording for both so it is only searched once.
+
+Make the queries specific enough to find high-quality, relevant sources.
+</Task>
+"""
+
 section_writer_instructions = """You are an expert technical writer crafting one section of a technical report.
 
 <Section topic>
@@ -162,6 +182,23 @@ If the section fails any criteria, generate specific follow-up search queries to
 </format>
 """
 
+section_follow_up_query_instructions = """You are an expert technical writer reviewing a draft report section and planning follow-up research.
+
+<Section topic>
+{section_topic}
+</Section topic>
+
+<Draft section>
+{section}
+</Draft section>
+
+<Task>
+Identify the most important gaps in technical accuracy or depth in the draft section, and generate {number_of_queries} web search queries that would find the missing information.
+
+The queries should be specific enough to find high-quality sources and should not repeat information the draft already covers.
+</Task>
+"""
+
 final_section_writer_instructions = """You are an expert technical writer crafting a section that synthesizes information from the rest of the report.
 
 <Section topic>
@@ -212,4 +249,4 @@ For Conclusion/Summary:
 - For conclusion: 100-150 word limit, ## for section title, only ONE structural element at most, no sources section
 - Markdown format
 - Do not include word count or any preamble in your response
-</Quality Checks>"""
\ No newline at end of file
+</Quality Checks>"""
@@ -1,56 +1,90 @@
 import asyncio
+import json
 import logging
 import operator
 import os
 import re
+import time
+import weakref
 import streamlit as st
 from dataclasses import dataclass, fields
 from enum import Enum
-from typing import Annotated, Any, List, Literal, Optional, TypedDict
+from functools import lru_cache
+from typing import Annotated, Any, List, Literal, Optional, TypedDict, get_type_hints
 
 from dotenv import load_dotenv
 import aiohttp
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.constants import Send
+from langgraph.constants import TAG_NOSTREAM, Send
 from langgraph.graph import END, START, StateGraph
 from langgraph.types import Command, interrupt
 from langsmith import traceable
 from pydantic import BaseModel, Field, ValidationError
-from tavily import AsyncTavilyClient, TavilyClient
+from tavily import AsyncTavilyClient
 
 from prompts import (
     DEFAULT_REPORT_STRUCTURE,
     report_planner_query_writer_instructions,
     report_planner_instructions,
     query_writer_instructions,
+    plan_query_writer_instructions,
     section_writer_instructions,
     section_grader_instructions,
+    section_follow_up_query_instructions,
     final_section_writer_instructions,
 )
+import instrumentation
+from instrumentation import instrument_node
+from llm_cache import get_llm_cache
+from passages import rank_sources, retrieve_passages
+from report_sink import DEFAULT_REPORT_DIR, get_report_sink
+from scheduler import Priority, estimate_tokens, get_run_limiter, get_scheduler, hedged_call
+from search_budget import HIGH_COVERAGE, SearchBudget, allocate_search_budgets, coverage, first_round_queries, spend
+from search_cache import get_search_cache
+from search_providers import SearchProvider, get_search_provider, register_search_provider
+from settings import as_bool, env_flag
+from source_store import get_source_store
+from sources import aload_encoding, deduplicate_sources, format_earlier_sources, index_source, normalize_url, pack_sources
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-llm_json = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0.5,
-    api_key=st.secrets["GOOGLE_API_KEY"],
-    response_mime_type="application/json"
-)
+LLM_MODEL = os.environ.get("LLM_MODEL", "gemini-2.0-flash")
+LLM_TEMPERATURE = float(os.environ.get("LLM_TEMPERATURE", 0.5))
+LLM_SEMANTIC_CACHE = env_flag("LLM_SEMANTIC_CACHE")
+
+def get_secret(name: str) -> str:
+    value = os.environ.get(name)
+    if value:
+        return value
+    return st.secrets[name]
+
+@lru_cache(maxsize=None)
+def get_llm_json() -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,
+        api_key=get_secret("GOOGLE_API_KEY"),
+        response_mime_type="application/json"
+    )
 
-llm_text = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0.5,
-    api_key=st.secrets["GOOGLE_API_KEY"]
-)
+@lru_cache(maxsize=None)
+def get_llm_text() -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,
+        api_key=get_secret("GOOGLE_API_KEY")
+    )
 
 class SearchAPI(Enum):
     PERPLEXITY = "perplexity"
     TAVILY = "tavily"
+    LOCAL = "local"
 
 @dataclass(kw_only=True)
 class Configuration:
@@ -58,16 +92,41 @@ class Configuration:
     number_of_queries: int = 2
     max_search_depth: int = 2
     search_api: SearchAPI = SearchAPI.TAVILY
+    max_concurrent_llm_calls: int = 8
+    source_token_budget: int = 24000
+    skip_grader_on_structural_pass: bool = False
+    speculative_search: bool = False
+    batch_section_queries: bool = False
+    reuse_planner_sources: bool = False
+    adaptive_search: bool = False
+    search_call_budget: int = 0
+    report_source_token_budget: int = 0
+    passage_retrieval: bool = False
+    passage_top_k: int = 20
+    reuse_stored_pages: bool = False
+    trace_dir: str = os.path.join(".cache", "traces")
+    report_sink: str = "file"
+    report_dir: str = DEFAULT_REPORT_DIR
+    report_formats: str = "md"
 
     @classmethod
     def from_runnable_config(cls, config: Optional[RunnableConfig] = None) -> "Configuration":
         configurable = config["configurable"] if config and "configurable" in config else {}
-        values: dict[str, Any] = {
-            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
-            for f in fields(cls)
-            if f.init
-        }
-        return cls(**{k: v for k, v in values.items() if v})
+        types = get_type_hints(cls)
+        values: dict[str, Any] = {}
+        for f in fields(cls):
+            if not f.init:
+                continue
+            value = os.environ.get(f.name.upper(), configurable.get(f.name))
+            if value is None or value == "":
+                continue
+            # Env vars always arrive as strings, so coerce by the field's declared type.
+            if types[f.name] is bool:
+                value = as_bool(value)
+            elif types[f.name] is int:
+                value = int(value)
+            values[f.name] = value
+        return cls(**values)
 
 class Section(BaseModel):
     name: str = Field(description="Name for this section of the report.")
@@ -84,6 +143,13 @@ class _SearchQuery(BaseModel):
 class Queries(BaseModel):
     queries: List[_SearchQuery] = Field(description="List of search queries.")
 
+class SectionQueries(BaseModel):
+    section_name: str = Field(description="Name of the section, exactly as given.")
+    queries: List[_SearchQuery] = Field(description="List of search queries for this section.")
+
+class PlanQueries(BaseModel):
+    sections: List[SectionQueries] = Field(description="Search queries for each section of the report.")
+
 class Feedback(BaseModel):
     grade: Literal["pass", "fail"] = Field(description="Evaluation result indicating whether the response meets requirements ('pass') or needs revision ('fail').")
     follow_up_queries: List[_SearchQuery] = Field(description="List of follow-up search queries.")
@@ -98,55 +164,150 @@ class ReportState(TypedDict):
     topic: str
     feedback_on_report_plan: str
     sections: list[Section]
+    planner_sources: list[dict]
     completed_sections: Annotated[list, operator.add]
     report_sections_from_research: str
+    batched_research: dict[str, dict]
     final_report: str
 
 class SectionState(TypedDict):
     section: Section
     search_iterations: int
     search_queries: list[_SearchQuery]
+    prefetched_results: list[dict]
+    planner_sources: list[dict]
     source_str: str
+    source_index: dict[str, dict]
+    search_budget: SearchBudget
     report_sections_from_research: str
     completed_sections: list[Section]
 
 class SectionOutputState(TypedDict):
     completed_sections: list[Section]
 
-tavily_client = TavilyClient(api_key=st.secrets["TAVILY_API_KEY"])
-tavily_async_client = AsyncTavilyClient(api_key=st.secrets["TAVILY_API_KEY"])
+@lru_cache(maxsize=None)
+def get_tavily_async_client() -> AsyncTavilyClient:
+    return AsyncTavilyClient(api_key=get_secret("TAVILY_API_KEY"))
 
 def get_config_value(value):
     return value if isinstance(value, str) else value.value
 
-def deduplicate_and_format_sources(search_response, max_tokens_per_source, include_raw_content=True):
-    sources_list = []
-    for response in search_response:
-        sources_list.extend(response['results'])
-
-    unique_sources = {source['url']: source for source in sources_list}
-
-    formatted_text = "Sources:\n\n"
-    for i, source in enumerate(unique_sources.values(), 1):
-        formatted_text += f"Source {source['title']}:\n===\n"
-        formatted_text += f"URL: {source['url']}\n===\n"
-        formatted_text += f"Most relevant content from source: {source['content']}\n===\n"
-        if include_raw_content:
-            char_limit = max_tokens_per_source * 4
-            raw_content = source.get('raw_content', '')
-            if raw_content is None:
-                raw_content = ''
-                logger.warning(f"No raw_content found for source: {source['url']}")
-            if len(raw_content) > char_limit:
-                raw_content = raw_content[:char_limit] + "... [truncated]"
-            formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
-
-    return formatted_text.strip()
+_http_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+HTTP_CONNECTION_LIMIT = int(os.environ.get("HTTP_CONNECTION_LIMIT", 100))
+HTTP_CONNECTION_LIMIT_PER_HOST = int(os.environ.get("HTTP_CONNECTION_LIMIT_PER_HOST", 10))
+TAVILY_QUERY_TIMEOUT = float(os.environ.get("TAVILY_QUERY_TIMEOUT", 60))
+TAVILY_HEDGE_AFTER = float(os.environ.get("TAVILY_HEDGE_AFTER", 15))
+TAVILY_EXTRACT_BATCH_SIZE = 20
+
+def get_http_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120))
+        _http_sessions[loop] = session
+    return session
+
+async def close_http_session():
+    session = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+def _llm_usage_tokens(response) -> Optional[int]:
+    usage_metadata = getattr(response, "usage_metadata", None)
+    return usage_metadata.get("total_tokens") if usage_metadata else None
+
+def _encode_llm_output(result) -> dict:
+    if isinstance(result, BaseModel):
+        return {"model": type(result).__name__, "data": result.model_dump()}
+    return {"content": result.content}
+
+def _decode_llm_output(value: dict, schema: Optional[type[BaseModel]] = None):
+    if "model" in value:
+        if schema is None or schema.__name__ != value["model"]:
+            raise ValueError(f"Cached {value['model']} output does not match the requested schema")
+        return schema.model_validate(value["data"])
+    return AIMessage(content=value["content"])
+
+async def ainvoke_llm(
+    llm,
+    messages,
+    config: Optional[RunnableConfig] = None,
+    priority: Priority = Priority.SECTION_WRITER,
+    stream_metadata: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+    semantic_text: Optional[str] = None,
+    semantic_params: Optional[dict] = None,
+    schema: Optional[type[BaseModel]] = None,
+):
+    # Only calls that carry stream_metadata are streamed to stream_mode="messages" consumers.
+    configurable = Configuration.from_runnable_config(config)
+    if schema is not None:
+        llm = llm.with_structured_output(schema)
+    llm_config = merge_configs(
+        config,
+        {"metadata": stream_metadata} if stream_metadata else {"tags": [TAG_NOSTREAM]},
+    )
+
+    with instrumentation.span("llm.gemini", namespace=cache_namespace or "", priority=Priority(priority).name) as llm_span:
+        # Exact-prompt caching is only sound for deterministic sampling; the similarity tier is opt-in.
+        semantic_text = semantic_text if LLM_SEMANTIC_CACHE else None
+        cache = get_llm_cache() if cache_namespace and (LLM_TEMPERATURE == 0 or semantic_text) else None
+        if cache is not None:
+            cache_params = {"model": LLM_MODEL, "temperature": LLM_TEMPERATURE, **(semantic_params or {})}
+            cache_key = cache.make_key(cache_namespace, cache_params, [(m.type, str(m.content)) for m in messages])
+            try:
+                cached = await cache.alookup(cache_key, cache_namespace, cache_params, semantic_text)
+                if cached is not None:
+                    llm_span.set("cache_hit", True)
+                    return _decode_llm_output(cached, schema)
+            except Exception as e:
+                logger.warning(f"LLM cache lookup failed: {e}")
+        llm_span.set("cache_hit", False)
+
+        prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        limiter = get_run_limiter(thread_id, int(configurable.max_concurrent_llm_calls)) if thread_id else None
+        result = await get_scheduler("gemini").run(
+            lambda: llm.ainvoke(messages, llm_config),
+            priority=priority,
+            tokens=prompt_tokens,
+            usage=_llm_usage_tokens,
+            limiter=limiter,
+        )
+        usage_metadata = getattr(result, "usage_metadata", None) or {}
+        instrumentation.record_usage(
+            "gemini",
+            input_tokens=usage_metadata.get("input_tokens", prompt_tokens),
+            output_tokens=usage_metadata.get("output_tokens", estimate_tokens(str(getattr(result, "content", "")))),
+        )
+
+        if cache is not None:
+            try:
+                await cache.aset(cache_key, cache_namespace, cache_params, _encode_llm_output(result), semantic_text)
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {e}")
+        return result
+
+EARLIER_SOURCES_BUDGET_SHARE = 0.15
+PLANNER_SOURCES_PER_SECTION = 5
+
+def flatten_search_results(search_response) -> list[dict]:
+    return [
+        {**source, "query": response.get('query')}
+        for response in search_response
+        for source in response['results']
+    ]
 
 def format_sections(sections: list[Section]) -> str:
-    formatted_str = ""
-    for idx, section in enumerate(sections, 1):
-        formatted_str += f"""
+    return "".join(
+        f"""
 {'='*60}
 Section {idx}: {section.name}
 {'='*60}
@@ -159,93 +320,213 @@ Content:
 {section.content if section.content else '[Not yet written]'}
 
 """
-    return formatted_str
+        for idx, section in enumerate(sections, 1)
+    )
 
-@traceable
-async def tavily_search_async(search_queries):
-    search_tasks = []
-    for query in search_queries:
-        search_tasks.append(
-            tavily_async_client.search(
-                query.search_query,
-                max_results=5,
-                include_raw_content=True,
-                topic="general"
-            )
-        )
+def _empty_search_doc(query: str) -> dict:
+    return {
+        "query": query,
+        "follow_up_questions": None,
+        "answer": None,
+        "images": [],
+        "results": []
+    }
 
-    try:
-        search_docs = await asyncio.gather(*search_tasks)
-        return search_docs
-    except Exception as e:
-        logger.error(f"Error in Tavily search: {e}")
-        return []
+async def tavily_extract_pages(urls: list[str], priority: Priority = Priority.SECTION_WRITER) -> dict[str, dict]:
+    scheduler = get_scheduler("tavily")
+    tavily_async_client = get_tavily_async_client()
+
+    async def extract_batch(batch):
+        with instrumentation.span("search.tavily_extract", urls=len(batch)) as extract_span:
+            try:
+                response = await hedged_call(
+                    lambda: scheduler.run(lambda: tavily_async_client.extract(urls=batch), priority=priority),
+                    timeout=TAVILY_QUERY_TIMEOUT,
+                    hedge_after=TAVILY_HEDGE_AFTER
+                )
+            except Exception as e:
+                logger.error(f"Error in Tavily extract for {len(batch)} URLs: {e}")
+                extract_span.status = "error"
+                extract_span.set("error", str(e))
+                return []
+            extract_span.set("bytes_fetched", len(json.dumps(response).encode("utf-8")))
+            # Extract is billed one request per five pages.
+            instrumentation.record_usage("tavily", requests=-(-len(batch) // 5))
+            return response.get("results", [])
+
+    batches = [urls[i:i + TAVILY_EXTRACT_BATCH_SIZE] for i in range(0, len(urls), TAVILY_EXTRACT_BATCH_SIZE)]
+    results = await asyncio.gather(*(extract_batch(batch) for batch in batches))
+    return {page["url"]: page for batch in results for page in batch if page.get("raw_content")}
+
+async def fill_raw_content(search_docs: list[dict], priority: Priority = Priority.SECTION_WRITER) -> None:
+    """Fill in missing ``raw_content`` from the source store, extracting only pages it does not have."""
+    store = get_source_store()
+    missing = list(dict.fromkeys(
+        result["url"] for search_doc in search_docs for result in search_doc["results"] if not result.get("raw_content")
+    ))
+    if not missing:
+        return
+    pages = await store.aget_many(missing)
+    to_extract = [url for url in missing if url not in pages]
+    if to_extract:
+        extracted = await tavily_extract_pages(to_extract, priority)
+        await store.aput_many({"url": url, "title": None, **page} for url, page in extracted.items())
+        pages.update(extracted)
+    for search_doc in search_docs:
+        for result in search_doc["results"]:
+            if not result.get("raw_content") and result["url"] in pages:
+                result["raw_content"] = pages[result["url"]]["raw_content"]
+    logger.info(f"Filled raw content for {len(missing)} pages: {len(missing) - len(to_extract)} stored, {len(to_extract)} extracted, store stats {store.stats()}")
+
+@traceable
+async def tavily_search_async(search_queries, priority: Priority = Priority.SECTION_WRITER, include_raw_content: bool = True, reuse_stored_pages: bool = False):
+    scheduler = get_scheduler("tavily")
+    tavily_async_client = get_tavily_async_client()
+    cache = get_search_cache()
+    store = get_source_store()
+    # When reusing stored pages, search for snippets only and fill page text from the store afterwards.
+    search_params = {"max_results": 5, "include_raw_content": include_raw_content and not reuse_stored_pages, "topic": "general"}
+    # Keyed without include_raw_content, so the planner's snippet searches and section searches share entries.
+    cache_params = {name: value for name, value in search_params.items() if name != "include_raw_content"}
+
+    async def search_one(query):
+        with instrumentation.span("search.tavily", query=query.search_query) as search_span:
+            cache_key = cache.make_key("tavily", query.search_query, **cache_params)
+            cached_doc = await cache.aget(cache_key)
+            search_span.set("cache_hit", cached_doc is not None)
+            if cached_doc is not None:
+                return cached_doc, True
+            try:
+                search_doc = await hedged_call(
+                    lambda: scheduler.run(
+                        lambda: tavily_async_client.search(query.search_query, **search_params),
+                        priority=priority
+                    ),
+                    timeout=TAVILY_QUERY_TIMEOUT,
+                    hedge_after=TAVILY_HEDGE_AFTER
+                )
+            except Exception as e:
+                logger.error(f"Error in Tavily search for query '{query.search_query}': {e}")
+                search_span.status = "error"
+                search_span.set("error", str(e))
+                return None, False
+            # The client hands back parsed JSON, so the serialized size stands in for the bytes received.
+            search_span.set("bytes_fetched", len(json.dumps(search_doc).encode("utf-8")))
+            instrumentation.record_usage("tavily")
+            await cache.aset(cache_key, "tavily", search_doc)
+            await store.aput_many(search_doc["results"])
+            return search_doc, False
+
+    outcomes = await asyncio.gather(*(search_one(query) for query in search_queries))
+    search_docs = [
+        search_doc if search_doc is not None else _empty_search_doc(query.search_query)
+        for query, (search_doc, _) in zip(search_queries, outcomes)
+    ]
+    cached = sum(1 for _, from_cache in outcomes if from_cache)
+    failed = sum(1 for search_doc, _ in outcomes if search_doc is None)
+    logger.info(f"Tavily search: {cached} cached, {len(outcomes) - cached - failed} fetched, {failed} failed, cache stats {cache.stats()}")
+    if include_raw_content:
+        # Documents searched without page text, here or by a planner search that cached them, are filled from the store.
+        snippet_docs = [
+            search_doc for search_doc in search_docs
+            if reuse_stored_pages or not any(result.get("raw_content") for result in search_doc["results"])
+        ]
+        if snippet_docs:
+            await fill_raw_content(snippet_docs, priority)
+    else:
+        # Cached entries may carry page text from a section search; snippet callers keep their results small.
+        for search_doc in search_docs:
+            for result in search_doc["results"]:
+                result["raw_content"] = None
+    return search_docs
 
 @traceable
-async def perplexity_search(search_queries):
+async def perplexity_search(search_queries, priority: Priority = Priority.SECTION_WRITER, include_raw_content: bool = True, reuse_stored_pages: bool = False):
     headers = {
         "accept": "application/json",
         "content-type": "application/json",
-        "Authorization": f"Bearer {st.secrets['PERPLEXITY_API_KEY']}"
+        "Authorization": f"Bearer {get_secret('PERPLEXITY_API_KEY')}"
     }
+    cache = get_search_cache()
+    session = get_http_session()
+    scheduler = get_scheduler("perplexity")
+
+    async def search_one(query):
+        with instrumentation.span("search.perplexity", query=query.search_query) as search_span:
+            return await fetch(query, search_span)
+
+    async def fetch(query, search_span):
+        cache_key = cache.make_key("perplexity", query.search_query, model="sonar-pro")
+        cached_doc = await cache.aget(cache_key)
+        search_span.set("cache_hit", cached_doc is not None)
+        if cached_doc is not None:
+            return cached_doc
+        payload = {
+            "model": "sonar-pro",
+            "messages": [
+                {"role": "system", "content": "Search the web and provide factual information with sources."},
+                {"role": "user", "content": query.search_query}
+            ]
+        }
 
-    async with aiohttp.ClientSession() as session:
-        search_docs = []
-        for query in search_queries:
-            payload = {
-                "model": "sonar-pro",
-                "messages": [
-                    {"role": "system", "content": "Search the web and provide factual information with sources."},
-                    {"role": "user", "content": query.search_query}
-                ]
-            }
-            try:
-                async with session.post(
-                    "https://api.perplexity.ai/chat/completions",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    content = data["choices"][0]["message"]["content"]
-                    citations = data.get("citations", ["https://perplexity.ai"])
-
-                    results = []
-                    results.append({
-                        "title": "Perplexity Search, Source 1",
-                        "url": citations[0],
-                        "content": content,
-                        "raw_content": content,
-                        "score": 1.0
-                    })
-                    for i, citation in enumerate(citations[1:], start=2):
-                        results.append({
-                            "title": f"Perplexity Search, Source {i}",
-                            "url": citation,
-                            "content": "See primary source for full content",
-                            "raw_content": None,
-                            "score": 0.5
-                        })
-                    search_docs.append({
-                        "query": query.search_query,
-                        "follow_up_questions": None,
-                        "answer": None,
-                        "images": [],
-                        "results": results
-                    })
-            except Exception as e:
-                logger.error(f"Error in Perplexity search for query '{query.search_query}': {e}")
-                search_docs.append({
-                    "query": query.search_query,
-                    "follow_up_questions": None,
-                    "answer": None,
-                    "images": [],
-                    "results": []
-                })
-        return search_docs
+        async def post():
+            async with session.post(
+                "https://api.perplexity.ai/chat/completions",
+                headers=headers,
+                json=payload
+            ) as response:
+                response.raise_for_status()
+                body = await response.read()
+            search_span.add("bytes_fetched", len(body))
+            return json.loads(body)
+
+        try:
+            data = await scheduler.run(post, priority=priority)
+            content = data["choices"][0]["message"]["content"]
+            citations = data.get("citations", ["https://perplexity.ai"])
+        except Exception as e:
+            logger.error(f"Error in Perplexity search for query '{query.search_query}': {e}")
+            search_span.status = "error"
+            search_span.set("error", str(e))
+            return _empty_search_doc(query.search_query)
+        usage = data.get("usage") or {}
+        instrumentation.record_usage("perplexity", usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+        results = []
+        results.append({
+            "title": "Perplexity Search, Source 1",
+            "url": citations[0],
+            "content": content,
+            "raw_content": content,
+            "score": 1.0
+        })
+        for i, citation in enumerate(citations[1:], start=2):
+            results.append({
+                "title": f"Perplexity Search, Source {i}",
+                "url": citation,
+                "content": "See primary source for full content",
+                "raw_content": None,
+                "score": 0.5
+            })
+        search_doc = {
+            "query": query.search_query,
+            "follow_up_questions": None,
+            "answer": None,
+            "images": [],
+            "results": results
+        }
+        await cache.aset(cache_key, "perplexity", search_doc)
+        return search_doc
+
+    return list(await asyncio.gather(*(search_one(query) for query in search_queries)))
+
+register_search_provider(SearchProvider("tavily", tavily_search_async, include_raw_content=True))
+register_search_provider(SearchProvider("perplexity", perplexity_search, include_raw_content=False))
 
+@instrument_node
 async def generate_report_plan(state: ReportState, config: RunnableConfig):
     logger.info("Generating report plan...")
+    await aload_encoding()
     topic = state["topic"]
     feedback = state.get("feedback_on_report_plan", None)
 
@@ -256,29 +537,30 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
     if isinstance(report_structure, dict):
         report_structure = str(report_structure)
 
-    structured_llm_queries = llm_json.with_structured_output(Queries)
     system_instructions_query = report_planner_query_writer_instructions.format(
         topic=topic, report_organization=report_structure, number_of_queries=number_of_queries
     )
     try:
-        results = await structured_llm_queries.ainvoke(
+        results = await ainvoke_llm(
+            get_llm_json(),
             [SystemMessage(content=system_instructions_query)] +
-            [HumanMessage(content="Generate search queries that will help with planning the sections of the report.")]
+            [HumanMessage(content="Generate search queries that will help with planning the sections of the report.")],
+            config,
+            priority=Priority.PLANNER,
+            cache_namespace="report_planner_queries",
+            semantic_text=topic,
+            semantic_params={"report_organization": report_structure, "number_of_queries": number_of_queries},
+            schema=Queries
         )
         query_list = [_SearchQuery(search_query=query.search_query) for query in results.queries]
     except Exception as e:
         logger.error(f"Error generating search queries: {e}")
         query_list = []
 
-    search_api = get_config_value(configurable.search_api)
-    if search_api == "tavily":
-        search_results = await tavily_search_async(query_list)
-        source_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000, include_raw_content=False)
-    elif search_api == "perplexity":
-        search_results = await perplexity_search(query_list)
-        source_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000, include_raw_content=False)
-    else:
-        raise ValueError(f"Unsupported search API: {configurable.search_api}")
+    search_provider = get_search_provider(get_config_value(configurable.search_api))
+    search_results = await search_provider.search(query_list, priority=Priority.PLANNER, include_raw_content=False)
+    planner_sources = deduplicate_sources(flatten_search_results(search_results))
+    source_str = pack_sources(planner_sources, max_tokens_per_source=1000, include_raw_content=False)
 
     system_instructions_sections = report_planner_instructions.format(
         topic=topic, report_organization=report_structure, context=source_str, feedback=feedback
@@ -315,15 +597,19 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
     """
 
     try:
-        raw_response = await llm_json.ainvoke(
+        raw_response = await ainvoke_llm(
+            get_llm_json(),
             [SystemMessage(content=system_instructions_sections)] +
-            [HumanMessage(content=human_message)]
+            [HumanMessage(content=human_message)],
+            config,
+            priority=Priority.PLANNER,
+            cache_namespace="report_planner_sections"
         )
         json_str = raw_response.content
         logger.info(f"Raw LLM output: {json_str}")
     except Exception as e:
         logger.error(f"Error generating report sections: {e}")
-        return {"sections": []}
+        return {"sections": [], "planner_sources": planner_sources}
 
     match = re.search(r'```json\n(.*?)\n```', json_str, re.DOTALL)
     if match:
@@ -341,8 +627,9 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
         logger.error(f"Validation error: {e}")
         sections = []
 
-    return {"sections": sections}
+    return {"sections": sections, "planner_sources": planner_sources}
 
+@instrument_node
 def human_feedback(state: ReportState, config: RunnableConfig):
     sections = state['sections']
     sections_str = "\n\n".join(
@@ -359,44 +646,255 @@ def human_feedback(state: ReportState, config: RunnableConfig):
 
     return {"feedback_on_report_plan": feedback}
 
-def generate_queries(state: SectionState, config: RunnableConfig):
+@instrument_node
+async def generate_queries(state: SectionState, config: RunnableConfig):
     logger.info("Generating search queries...")
     section = state["section"]
     configurable = Configuration.from_runnable_config(config)
-    number_of_queries = configurable.number_of_queries
+    number_of_queries = first_round_query_count(state, configurable)
+    if not number_of_queries:
+        return {"search_queries": []}
 
-    structured_llm = llm_json.with_structured_output(Queries)
     system_instructions = query_writer_instructions.format(section_topic=section.description, number_of_queries=number_of_queries)
     try:
-        queries = structured_llm.invoke(
+        queries = await ainvoke_llm(
+            get_llm_json(),
             [SystemMessage(content=system_instructions)] +
-            [HumanMessage(content="Generate search queries on the provided topic.")]
+            [HumanMessage(content="Generate search queries on the provided topic.")],
+            config,
+            cache_namespace="section_queries",
+            semantic_text=section.description,
+            semantic_params={"number_of_queries": number_of_queries},
+            schema=Queries
         )
-        return {"search_queries": queries.queries}
+        return {"search_queries": queries.queries[:number_of_queries]}
     except Exception as e:
         logger.error(f"Error generating queries: {e}")
         return {"search_queries": []}
 
+def queries_per_round(state: SectionState, configurable: Configuration) -> int:
+    budget = state.get("search_budget")
+    return budget["queries_per_round"] if budget else int(configurable.number_of_queries)
+
+def first_round_query_count(state: SectionState, configurable: Configuration) -> int:
+    """Queries for the first search round, fewer when the planner's sources for the section already cover part of it."""
+    number_of_queries = queries_per_round(state, configurable)
+    planner_sources = state.get("planner_sources")
+    if planner_sources:
+        number_of_queries = first_round_queries(number_of_queries, coverage(state["section"].description, planner_sources))
+    return number_of_queries
+
+def can_search_again(state: SectionState, configurable: Configuration) -> bool:
+    budget = state.get("search_budget")
+    if budget:
+        return state["search_iterations"] < budget["max_depth"] and budget["remaining_queries"] > 0
+    return state["search_iterations"] < int(configurable.max_search_depth)
+
+async def gather_sources(
+    state: SectionState,
+    query_list: list[_SearchQuery],
+    configurable: Configuration,
+    priority: Priority = Priority.SECTION_WRITER,
+    search_results: Optional[list[dict]] = None,
+    prefetched_sources: list[dict] = (),
+) -> dict:
+    # Resumed runs skip the planner, so the encoding is loaded here too; once loaded this returns at once.
+    await aload_encoding()
+    search_provider = get_search_provider(get_config_value(configurable.search_api))
+    section = state["section"]
+    budget = state.get("search_budget")
+    if budget:
+        query_list = query_list[:budget["remaining_queries"]]
+    token_budget = budget["source_tokens"] if budget else int(configurable.source_token_budget)
+    source_index = dict(state.get("source_index") or {})
+    iteration = state["search_iterations"] + 1
+
+    if search_results is None:
+        search_results = await search_provider.search(
+            query_list, priority=priority, reuse_stored_pages=configurable.reuse_stored_pages
+        ) if query_list else []
+
+    new_sources = deduplicate_sources([*prefetched_sources, *flatten_search_results(search_results)], known=source_index.values())
+    logger.info(f"Search iteration {iteration} for '{section.name}': {len(new_sources)} new sources, {len(source_index)} already known")
+
+    earlier_str = ""
+    if source_index:
+        earlier_budget = int(token_budget * EARLIER_SOURCES_BUDGET_SHARE)
+        earlier_str = format_earlier_sources(source_index.values(), section.description, earlier_budget)
+        token_budget -= earlier_budget
+
+    if configurable.passage_retrieval:
+        source_str = retrieve_passages(new_sources, section.description, token_budget, int(configurable.passage_top_k))
+    else:
+        source_str = pack_sources(
+            new_sources, max_tokens_per_source=5000, include_raw_content=search_provider.include_raw_content,
+            token_budget=token_budget, query=section.description
+        )
+    if earlier_str:
+        source_str = f"{source_str}\n\n{earlier_str}"
+
+    for source in new_sources:
+        source_index[normalize_url(source['url'])] = index_source(source, iteration)
+
+    update = {"source_str": source_str, "source_index": source_index, "search_iterations": iteration}
+    if budget:
+        first_round_coverage = coverage(section.description, new_sources) if iteration == 1 else None
+        update["search_budget"] = spend(budget, len(query_list), iteration, first_round_coverage)
+        logger.info(f"Search budget for '{section.name}' after iteration {iteration}: {update['search_budget']}")
+    return update
+
+async def load_planner_sources(planner_sources: list[dict]) -> list[dict]:
+    """Planner search results with page text from the source store where it has them, else their snippets."""
+    pages = await get_source_store().aget_many(source["url"] for source in planner_sources)
+    return [
+        {**source, "raw_content": pages[source["url"]]["raw_content"] if source["url"] in pages else source["content"]}
+        for source in planner_sources
+    ]
+
+@instrument_node
 async def search_web(state: SectionState, config: RunnableConfig):
     logger.info("Searching the web...")
-    search_queries = state["search_queries"]
+    await aload_encoding()
+    section = state["section"]
+    search_queries = state.get("search_queries") or []
     configurable = Configuration.from_runnable_config(config)
 
     query_list = [_SearchQuery(search_query=query.search_query) for query in search_queries]
-    search_api = get_config_value(configurable.search_api)
-
-    if search_api == "tavily":
-        search_results = await tavily_search_async(query_list)
-        source_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=5000, include_raw_content=True)
-    elif search_api == "perplexity":
-        search_results = await perplexity_search(query_list)
-        source_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=5000, include_raw_content=False)
-    else:
-        raise ValueError(f"Unsupported search API: {configurable.search_api}")
+    if state["search_iterations"] > 0:
+        return await gather_sources(state, query_list, configurable)
+
+    # The first round's query count already allows for the planner sources (see first_round_query_count
+    # and batch_search_sections), which join the round's results.
+    planner_sources = await load_planner_sources(state.get("planner_sources") or [])
+    if planner_sources:
+        logger.info(f"Reusing {len(planner_sources)} planner sources for '{section.name}' alongside {len(query_list)} queries")
+    # Results searched for the whole plan at once only stand in for the first round.
+    return await gather_sources(
+        state, query_list, configurable, search_results=state.get("prefetched_results"), prefetched_sources=planner_sources
+    )
+
+def section_budgets(research_sections: list[Section], configurable: Configuration) -> dict[str, SearchBudget]:
+    if not configurable.adaptive_search:
+        return {}
+    return allocate_search_budgets(
+        research_sections,
+        number_of_queries=int(configurable.number_of_queries),
+        max_search_depth=int(configurable.max_search_depth),
+        source_token_budget=int(configurable.source_token_budget),
+        search_call_budget=int(configurable.search_call_budget),
+        report_token_budget=int(configurable.report_source_token_budget),
+    )
+
+def _query_key(query: str) -> str:
+    return " ".join(query.lower().split())
 
-    return {"source_str": source_str, "search_iterations": state["search_iterations"] + 1}
+@instrument_node
+async def batch_search_sections(state: ReportState, config: RunnableConfig):
+    """Write the first round of queries for every research section in one call and search each distinct query once."""
+    logger.info("Generating search queries for all sections...")
+    configurable = Configuration.from_runnable_config(config)
+    research_sections = [s for s in state["sections"] if s.research]
+    budgets = section_budgets(research_sections, configurable)
+    query_counts = {
+        s.name: budgets[s.name]["queries_per_round"] if s.name in budgets else int(configurable.number_of_queries)
+        for s in research_sections
+    }
+    if configurable.reuse_planner_sources:
+        planner_sources = state.get("planner_sources") or []
+        for s in research_sections:
+            matched = rank_sources(planner_sources, s.description, PLANNER_SOURCES_PER_SECTION)
+            if matched:
+                query_counts[s.name] = first_round_queries(query_counts[s.name], coverage(s.description, matched))
+        research_sections = [s for s in research_sections if query_counts[s.name]]
+        if not research_sections:
+            return {"batched_research": {}}
+    sections_str = "\n\n".join(
+        f"Section: {s.name}\nDescription: {s.description}\nNumber of queries: {query_counts[s.name]}"
+        for s in research_sections
+    )
+
+    try:
+        results = await ainvoke_llm(
+            get_llm_json(),
+            [SystemMessage(content=plan_query_writer_instructions.format(sections=sections_str))] +
+            [HumanMessage(content="Generate search queries for every section.")],
+            config,
+            cache_namespace="plan_section_queries",
+            schema=PlanQueries
+        )
+    except Exception as e:
+        logger.error(f"Error generating batched queries: {e}")
+        return {"batched_research": {}}
+
+    # Sections the model left out or renamed fall back to writing their own queries.
+    section_queries: dict[str, list[str]] = {}
+    unique_queries: dict[str, str] = {}
+    for entry in results.sections:
+        if entry.section_name not in query_counts or entry.section_name in section_queries:
+            continue
+        queries: dict[str, str] = {}
+        for query in entry.queries:
+            key = _query_key(query.search_query or "")
+            if key:
+                queries.setdefault(key, query.search_query)
+        keys = list(queries)[:query_counts[entry.section_name]]
+        if not keys:
+            continue
+        for key in keys:
+            unique_queries.setdefault(key, queries[key])
+        section_queries[entry.section_name] = keys
+
+    searched = list(unique_queries)
+    search_provider = get_search_provider(get_config_value(configurable.search_api))
+    search_results = await search_provider.search(
+        [_SearchQuery(search_query=unique_queries[key]) for key in searched], reuse_stored_pages=configurable.reuse_stored_pages
+    )
+    results_by_key = dict(zip(searched, search_results))
+    logger.info(
+        f"Batched {sum(len(keys) for keys in section_queries.values())} queries for {len(section_queries)} of "
+        f"{len(research_sections)} sections into {len(searched)} searches"
+    )
+
+    return {"batched_research": {
+        name: {
+            "search_queries": [_SearchQuery(search_query=unique_queries[key]) for key in keys],
+            "prefetched_results": [results_by_key[key] for key in keys],
+        }
+        for name, keys in section_queries.items()
+    }}
+
+def passes_structural_checks(content: str, min_words: int = 150, max_words: int = 220, min_sources: int = 2) -> bool:
+    if not content or content.startswith("[Error"):
+        return False
+    body, _, sources = content.partition("### Sources")
+    lines = [line.strip() for line in body.strip().splitlines() if line.strip()]
+    if not lines or not lines[0].startswith("## "):
+        return False
+    if not lines[1:] or not lines[1].startswith("**"):
+        return False
+    word_count = len(re.findall(r"\w+", " ".join(lines[1:])))
+    if not min_words <= word_count <= max_words:
+        return False
+    return len(re.findall(r"https?://", sources)) >= min_sources
+
+async def speculative_follow_up(state: SectionState, section: Section, config: RunnableConfig, configurable: Configuration) -> dict:
+    system_instructions = section_follow_up_query_instructions.format(
+        section_topic=section.description, section=section.content, number_of_queries=queries_per_round(state, configurable)
+    )
+    queries = await ainvoke_llm(
+        get_llm_json(),
+        [SystemMessage(content=system_instructions)] +
+        [HumanMessage(content="Generate follow-up search queries for the gaps in this section.")],
+        config,
+        priority=Priority.SPECULATIVE,
+        cache_namespace="section_follow_up_queries",
+        schema=Queries
+    )
+    query_list = [_SearchQuery(search_query=query.search_query) for query in queries.queries]
+    return await gather_sources(state, query_list, configurable, priority=Priority.SPECULATIVE)
 
-def write_section(state: SectionState, config: RunnableConfig) -> Command[Literal[END, "search_web"]]:
+@instrument_node
+async def write_section(state: SectionState, config: RunnableConfig) -> Command[Literal[END, "search_web", "write_section"]]:
     logger.info("Writing section...")
     section = state["section"]
     source_str = state["source_str"]
@@ -407,48 +905,80 @@ def write_section(state: SectionState, config: RunnableConfig) -> Command[Litera
     )
 
     try:
-        section_content = llm_text.invoke(
+        section_content = await ainvoke_llm(
+            get_llm_text(),
             [SystemMessage(content=system_instructions)] +
-            [HumanMessage(content="Generate a report section based on the provided sources.")]
+            [HumanMessage(content="Generate a report section based on the provided sources.")],
+            config,
+            stream_metadata={"stream_role": "section_writer", "section": section.name, "iteration": state["search_iterations"]},
+            cache_namespace="section_writer"
         )
         section.content = section_content.content
     except Exception as e:
         logger.error(f"Error writing section: {e}")
         section.content = "[Error generating content]"
 
+    if configurable.skip_grader_on_structural_pass and passes_structural_checks(section.content):
+        logger.info(f"Section '{section.name}' passed structural checks, skipping grader")
+        return Command(update={"completed_sections": [section]}, goto=END)
+
+    search_again = can_search_again(state, configurable)
+    speculation = None
+    if configurable.speculative_search and search_again:
+        # Search for follow-up material while the grader runs; discarded if the section passes.
+        speculation = asyncio.create_task(speculative_follow_up(state, section, config, configurable))
+
     section_grader_instructions_formatted = section_grader_instructions.format(
         section_topic=section.description, section=section.content
     )
 
-    structured_llm = llm_json.with_structured_output(Feedback)
     try:
-        feedback = structured_llm.invoke(
+        feedback = await ainvoke_llm(
+            get_llm_json(),
             [SystemMessage(content=section_grader_instructions_formatted)] +
-            [HumanMessage(content="Grade the report and consider follow-up questions for missing information:")]
+            [HumanMessage(content="Grade the report and consider follow-up questions for missing information:")],
+            config,
+            priority=Priority.GRADER,
+            cache_namespace="section_grader",
+            schema=Feedback
         )
     except Exception as e:
         logger.error(f"Error grading section: {e}")
         feedback = Feedback(grade="fail", follow_up_queries=[])
 
-    if feedback.grade == "pass" or state["search_iterations"] >= configurable.max_search_depth:
+    if feedback.grade == "pass" or not search_again:
+        if speculation is not None:
+            speculation.cancel()
+            await asyncio.gather(speculation, return_exceptions=True)
         return Command(update={"completed_sections": [section]}, goto=END)
-    else:
-        return Command(update={"search_queries": feedback.follow_up_queries, "section": section}, goto="search_web")
 
-def write_final_sections(state: SectionState, config: RunnableConfig):
+    if speculation is not None:
+        try:
+            sources_update = await speculation
+            return Command(update={**sources_update, "section": section}, goto="write_section")
+        except Exception as e:
+            logger.error(f"Error in speculative follow-up search: {e}")
+
+    return Command(update={"search_queries": feedback.follow_up_queries, "section": section}, goto="search_web")
+
+@instrument_node
+async def write_final_sections(state: SectionState, config: RunnableConfig):
     logger.info("Writing final sections...")
-    configurable = Configuration.from_runnable_config(config)
     section = state["section"]
     completed_report_sections = state["report_sections_from_research"]
-    
+
     system_instructions = final_section_writer_instructions.format(
         section_title=section.name, section_topic=section.description, context=completed_report_sections
     )
 
     try:
-        section_content = llm_text.invoke(
+        section_content = await ainvoke_llm(
+            get_llm_text(),
             [SystemMessage(content=system_instructions)] +
-            [HumanMessage(content="Generate a report section based on the provided sources.")]
+            [HumanMessage(content="Generate a report section based on the provided sources.")],
+            config,
+            stream_metadata={"stream_role": "final_section_writer", "section": section.name, "iteration": 0},
+            cache_namespace="final_section_writer"
         )
         section.content = section_content.content
     except Exception as e:
@@ -457,6 +987,7 @@ def write_final_sections(state: SectionState, config: RunnableConfig):
 
     return {"completed_sections": [section]}
 
+@instrument_node
 def gather_completed_sections(state: ReportState):
     logger.info("Gathering completed sections...")
     completed_sections = state["completed_sections"]
@@ -465,13 +996,15 @@ def gather_completed_sections(state: ReportState):
 
 def initiate_final_section_writing(state: ReportState):
     logger.info("Initiating final section writing...")
-    return [
+    sends = [
         Send("write_final_sections", {"section": s, "report_sections_from_research": state["report_sections_from_research"]})
         for s in state["sections"]
         if not s.research
     ]
+    return sends or "compile_final_report"
 
-def compile_final_report(state: ReportState):
+@instrument_node
+async def compile_final_report(state: ReportState, config: RunnableConfig):
     logger.info("Compiling final report...")
     sections = state["sections"]
     completed_sections = {s.name: s.content for s in state["completed_sections"]}
@@ -485,23 +1018,58 @@ def compile_final_report(state: ReportState):
 
     all_sections = "\n\n".join([s.content for s in sections])
 
-    with open("data/final_report.md", "w") as f:
-        f.write(all_sections)
-
+    configurable = Configuration.from_runnable_config(config)
+    run_id = config.get("configurable", {}).get("thread_id") or f"report_{int(time.time())}"
+    try:
+        sink = get_report_sink(configurable.report_sink, configurable.report_dir, configurable.report_formats)
+        paths = await sink.write(run_id, all_sections, {"topic": state["topic"], "sections": [s.name for s in sections]})
+        if paths:
+            logger.info(f"Report written to {', '.join(paths)}")
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not write report for '{run_id}': {e}")
+
+    await export_run_trace(config)
     return {"final_report": all_sections}
 
+async def export_run_trace(config: RunnableConfig) -> Optional[dict]:
+    """Write the run's trace and summary to ``trace_dir`` and release it; failed runs call this too."""
+    thread_id = (config or {}).get("configurable", {}).get("thread_id")
+    if not thread_id:
+        return None
+    configurable = Configuration.from_runnable_config(config)
+    try:
+        summary = await asyncio.to_thread(instrumentation.export_trace, str(thread_id), configurable.trace_dir)
+        if summary is not None:
+            logger.info(f"Run summary: {summary['wall_time_s']}s wall time, {summary['totals']}")
+        return summary
+    except OSError as e:
+        logger.warning(f"Could not write trace for '{thread_id}': {e}")
+        instrumentation.discard_trace(str(thread_id))
+        return None
+
 section_builder = StateGraph(SectionState, output=SectionOutputState)
 section_builder.add_node("generate_queries", generate_queries)
 section_builder.add_node("search_web", search_web)
 section_builder.add_node("write_section", write_section)
 
-section_builder.add_edge(START, "generate_queries")
+def route_section_start(state: SectionState) -> Literal["generate_queries", "search_web"]:
+    # Sections whose queries were written and searched with the rest of the plan, or whose planner
+    # sources already cover them, go straight to search_web.
+    if state.get("search_queries"):
+        return "search_web"
+    planner_sources = state.get("planner_sources")
+    if planner_sources and coverage(state["section"].description, planner_sources) >= HIGH_COVERAGE:
+        return "search_web"
+    return "generate_queries"
+
+section_builder.add_conditional_edges(START, route_section_start)
 section_builder.add_edge("generate_queries", "search_web")
 section_builder.add_edge("search_web", "write_section")
 
 builder = StateGraph(ReportState, input=ReportStateInput, output=ReportStateOutput, config_schema=Configuration)
 builder.add_node("generate_report_plan", generate_report_plan)
 builder.add_node("human_feedback", human_feedback)
+builder.add_node("batch_search_sections", batch_search_sections)
 builder.add_node("build_section_with_web_research", section_builder.compile())
 builder.add_node("gather_completed_sections", gather_completed_sections)
 builder.add_node("write_final_sections", write_final_sections)
@@ -510,34 +1078,64 @@ builder.add_node("compile_final_report", compile_final_report)
 builder.add_edge(START, "generate_report_plan")
 builder.add_edge("generate_report_plan", "human_feedback")
 
-def route_after_feedback(state: ReportState):
+def section_research_sends(state: ReportState, configurable: Configuration) -> list[Send]:
+    research_sections = [s for s in state["sections"] if s.research]
+    budgets = section_budgets(research_sections, configurable)
+    if budgets:
+        logger.info(f"Search budgets: {budgets}")
+    batched_research = state.get("batched_research") or {}
+    planner_sources = (state.get("planner_sources") or []) if configurable.reuse_planner_sources else []
+    sends = []
+    for s in research_sections:
+        payload = {"section": s, "search_iterations": 0, **batched_research.get(s.name, {})}
+        if s.name in budgets:
+            payload["search_budget"] = budgets[s.name]
+        if planner_sources:
+            payload["planner_sources"] = rank_sources(planner_sources, s.description, PLANNER_SOURCES_PER_SECTION)
+        sends.append(Send("build_section_with_web_research", payload))
+    logger.info(f"Sending to build_section_with_web_research: {len(sends)} sections")
+    return sends
+
+def route_after_feedback(state: ReportState, config: RunnableConfig):
     feedback = state.get("feedback_on_report_plan")
     logger.info(f"Routing based on feedback: {feedback}")
     if feedback == "true" or feedback is True:
-        sends = [
-            Send("build_section_with_web_research", {"section": s, "search_iterations": 0})
-            for s in state["sections"]
-            if s.research
-        ]
-        logger.info(f"Sending to build_section_with_web_research: {len(sends)} sections")
-        return sends
+        configurable = Configuration.from_runnable_config(config)
+        if configurable.batch_section_queries and any(s.research for s in state["sections"]):
+            return "batch_search_sections"
+        return section_research_sends(state, configurable)
     else:
         logger.info("Regenerating report plan due to feedback.")
         return "generate_report_plan"
 
+def route_after_batch_search(state: ReportState, config: RunnableConfig):
+    return section_research_sends(state, Configuration.from_runnable_config(config))
+
 builder.add_conditional_edges("human_feedback", route_after_feedback, {
     "generate_report_plan": "generate_report_plan",
+    "batch_search_sections": "batch_search_sections",
 })
+builder.add_conditional_edges("batch_search_sections", route_after_batch_search, ["build_section_with_web_research"])
 
 builder.add_edge("build_section_with_web_research", "gather_completed_sections")
-builder.add_conditional_edges("gather_completed_sections", initiate_final_section_writing, ["write_final_sections"])
+builder.add_conditional_edges("gather_completed_sections", initiate_final_section_writing, ["write_final_sections", "compile_final_report"])
 builder.add_edge("write_final_sections", "compile_final_report")
 builder.add_edge("compile_final_report", END)
 
-graph = builder.compile()
-mermaid_png = graph.get_graph(xray=1).draw_mermaid_png()
-with open("graph_visualization.png", "wb") as f:
-    f.write(mermaid_png)
+@lru_cache(maxsize=None)
+def get_graph():
+    return builder.compile()
+
+def __getattr__(name):
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def draw_graph(path: str = "graph_visualization.png") -> str:
+    mermaid_png = get_graph().get_graph(xray=1).draw_mermaid_png()
+    with open(path, "wb") as f:
+        f.write(mermaid_png)
+    return path
 
 async def get_terminal_input(prompt: str) -> str:
     print(prompt)
@@ -545,22 +1143,39 @@ async def get_terminal_input(prompt: str) -> str:
     return await loop.run_in_executor(None, input, "Your feedback: ")
 
 if __name__ == "__main__":
-    from langgraph.checkpoint.memory import MemorySaver
+    import argparse
+    import uuid
+    from checkpointer import get_checkpointer
+
+    parser = argparse.ArgumentParser(description="Run the example report or render the graph.")
+    parser.add_argument("--thread-id", default=None,
+                        help="Checkpoint thread to resume; a new thread is started when omitted.")
+    parser.add_argument("--draw-graph", nargs="?", const="graph_visualization.png", metavar="PATH",
+                        help="Render the graph as a Mermaid PNG and exit.")
+    args = parser.parse_args()
+    if args.draw_graph:
+        print(f"Graph visualization written to {draw_graph(args.draw_graph)}")
+        raise SystemExit(0)
 
     async def run_example():
-        memory = MemorySaver()
-        graph_instance = builder.compile(checkpointer=memory)
+        graph_instance = builder.compile(checkpointer=get_checkpointer())
         thread = {
             "configurable": {
-                "thread_id": "example_thread",
+                "thread_id": args.thread_id or f"example_{uuid.uuid4().hex}",
                 "search_api": "tavily",
                 "max_search_depth": 1,
             }
         }
         topic = "Overview of the AI inference market with focus on Fireworks, Together.ai, Groq"
 
-        logger.info("Starting graph execution...")
-        async for event in graph_instance.astream({"topic": topic}, thread, stream_mode="updates"):
+        snapshot = await graph_instance.aget_state(thread)
+        if snapshot.values and not snapshot.next:
+            print("Final report:\n", snapshot.values.get("final_report"))
+            return
+
+        logger.info("Starting graph execution..." if not snapshot.values else "Resuming graph execution from checkpoint...")
+        initial_input = None if snapshot.values else {"topic": topic}
+        async for event in graph_instance.astream(initial_input, thread, stream_mode="updates"):
             logger.info(f"Initial event: {event}")
             if '__interrupt__' in event:
                 interrupt_value = event['__interrupt__'][0].value
@@ -597,4 +1212,10 @@ if __name__ == "__main__":
                         print(interrupt_value)
                         break
 
-    asyncio.run(run_example())
\ No newline at end of file
+    async def main():
+        try:
+            await run_example()
+        finally:
+            await close_http_session()
+
+    asyncio.run(main())
\ No newline at end of file
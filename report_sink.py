@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_DIR = os.path.join("data", "reports")
+
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+def safe_name(name: str) -> str:
+    return _UNSAFE_CHARS_RE.sub("_", name).strip(".") or "report"
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write ``data`` to ``path`` so that readers see either the old file or the complete new one."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+class ReportSink(ABC):
+    """Destination for finished reports. ``write`` returns the locations the report was stored at."""
+
+    @abstractmethod
+    async def write(self, run_id: str, report: str, metadata: dict[str, Any]) -> list[str]:
+        ...
+
+class NullReportSink(ReportSink):
+    async def write(self, run_id: str, report: str, metadata: dict[str, Any]) -> list[str]:
+        return []
+
+class FileReportSink(ReportSink):
+    """Writes each run's report under its own name in ``directory``, in one or more formats.
+
+    Formats are ``md`` (the report), ``json`` (report plus metadata) and ``md.gz`` (gzip-compressed
+    report). Every file is written atomically off the event loop, so concurrent runs can share one
+    directory.
+    """
+
+    FORMATS: dict[str, Callable[[str, dict[str, Any]], bytes]] = {
+        "md": lambda report, metadata: report.encode("utf-8"),
+        "json": lambda report, metadata: json.dumps({**metadata, "report": report}, indent=2).encode("utf-8"),
+        "md.gz": lambda report, metadata: gzip.compress(report.encode("utf-8"), mtime=0),
+    }
+
+    def __init__(self, directory: str = DEFAULT_REPORT_DIR, formats: Iterable[str] = ("md",)):
+        self.directory = directory
+        self.formats = list(formats)
+        unknown = [f for f in self.formats if f not in self.FORMATS]
+        if unknown:
+            raise ValueError(f"Unknown report formats {unknown}; expected any of {list(self.FORMATS)}")
+
+    def _write_all(self, run_id: str, report: str, metadata: dict[str, Any]) -> list[str]:
+        paths = []
+        for report_format in self.formats:
+            path = os.path.join(self.directory, f"{safe_name(run_id)}.{report_format}")
+            atomic_write(path, self.FORMATS[report_format](report, metadata))
+            paths.append(path)
+        return paths
+
+    async def write(self, run_id: str, report: str, metadata: dict[str, Any]) -> list[str]:
+        return await asyncio.to_thread(self._write_all, run_id, report, {"run_id": run_id, "written_at": time.time(), **metadata})
+
+REPORT_SINKS: dict[str, Callable[..., ReportSink]] = {
+    "file": FileReportSink,
+    "none": lambda **_: NullReportSink(),
+}
+
+def register_report_sink(name: str, factory: Callable[..., ReportSink]) -> None:
+    REPORT_SINKS[name] = factory
+
+def get_report_sink(name: str = "file", directory: str = DEFAULT_REPORT_DIR, formats: str = "md") -> ReportSink:
+    if name not in REPORT_SINKS:
+        raise ValueError(f"Unknown report sink '{name}'; expected any of {list(REPORT_SINKS)}")
+    return REPORT_SINKS[name](directory=directory, formats=[f.strip() for f in formats.split(",") if f.strip()])
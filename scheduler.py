@@ -0,0 +1,284 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+import weakref
+from contextlib import nullcontext
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class Priority(IntEnum):
+    PLANNER = 0
+    SECTION_WRITER = 1
+    GRADER = 2
+    SPECULATIVE = 3
+
+@dataclass
+class ProviderLimits:
+    requests_per_minute: float
+    tokens_per_minute: Optional[float] = None
+    max_concurrency: int = 8
+    max_retries: int = 5
+    backoff_base: float = 1.0
+    backoff_cap: float = 60.0
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+PROVIDER_LIMITS: dict[str, ProviderLimits] = {
+    "gemini": ProviderLimits(
+        requests_per_minute=_env_float("GEMINI_RPM", 1000),
+        tokens_per_minute=_env_float("GEMINI_TPM", 4_000_000),
+        max_concurrency=int(_env_float("GEMINI_MAX_CONCURRENCY", 8)),
+    ),
+    "tavily": ProviderLimits(
+        requests_per_minute=_env_float("TAVILY_RPM", 100),
+        max_concurrency=int(_env_float("TAVILY_MAX_CONCURRENCY", 20)),
+    ),
+    "perplexity": ProviderLimits(
+        requests_per_minute=_env_float("PERPLEXITY_RPM", 50),
+        max_concurrency=int(_env_float("PERPLEXITY_MAX_CONCURRENCY", 5)),
+    ),
+}
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, amount: float) -> float:
+        # Requests larger than the burst capacity wait for a full bucket and then run into debt.
+        self._refill()
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def pause(self, seconds: float) -> None:
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    for attr in ("status", "status_code", "code"):
+        if getattr(error, attr, None) == 429:
+            return True
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "resourceexhausted" in text or "rate limit" in text or "quota" in text
+
+def is_retryable_error(error: BaseException) -> bool:
+    if is_rate_limit_error(error) or isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    for attr in ("status", "status_code", "code"):
+        status = getattr(error, attr, None)
+        if isinstance(status, int) and 500 <= status < 600:
+            return True
+    text = f"{type(error).__name__} {error}".lower()
+    return "serviceunavailable" in text or "deadlineexceeded" in text or "internalservererror" in text
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+class ProviderScheduler:
+    """Admits calls to one provider in priority order under RPM, TPM and concurrency budgets, retrying transient failures."""
+
+    def __init__(self, name: str, limits: ProviderLimits):
+        self.name = name
+        self.limits = limits
+        self.max_concurrency = limits.max_concurrency
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        self._condition = asyncio.Condition()
+        self._waiters: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _delay(self, tokens: float) -> float:
+        delay = self.requests.delay(1)
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    async def _acquire(self, priority: int, tokens: float) -> None:
+        entry = (int(priority), next(self._sequence))
+        async with self._condition:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] == entry and self._in_flight < self.max_concurrency:
+                        delay = self._delay(tokens)
+                        if delay <= 0:
+                            heapq.heappop(self._waiters)
+                            self._in_flight += 1
+                            self.requests.consume(1)
+                            if self.tokens is not None and tokens:
+                                self.tokens.consume(tokens)
+                            self._condition.notify_all()
+                            return
+                        try:
+                            await asyncio.wait_for(self._condition.wait(), delay)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._condition.wait()
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._condition.notify_all()
+                raise
+
+    async def _release(self, token_correction: float = 0) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            if self.tokens is not None and token_correction:
+                self.tokens.consume(token_correction)
+            self._condition.notify_all()
+
+    async def _penalize(self, seconds: float) -> None:
+        async with self._condition:
+            self.requests.pause(seconds)
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        *,
+        priority: int = Priority.SECTION_WRITER,
+        tokens: float = 0,
+        usage: Optional[Callable[[Any], Optional[float]]] = None,
+        limiter: Optional[asyncio.Semaphore] = None,
+    ) -> T:
+        # ``limiter`` caps one run's share of the provider without touching the limit other runs see.
+        async with limiter or nullcontext():
+            return await self._run(call, priority, tokens, usage)
+
+    async def _run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        priority: int,
+        tokens: float,
+        usage: Optional[Callable[[Any], Optional[float]]],
+    ) -> T:
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self._acquire(priority, tokens)
+            instrumentation.increment("queue_wait_s", time.monotonic() - queued_at)
+            correction = 0.0
+            try:
+                result = await call()
+                if usage is not None:
+                    actual = usage(result)
+                    if actual is not None:
+                        correction = actual - tokens
+                return result
+            except Exception as e:
+                if attempt >= self.limits.max_retries or not is_retryable_error(e):
+                    raise
+                attempt += 1
+                self.retries += 1
+                instrumentation.increment("retries")
+                delay = random.uniform(0, min(self.limits.backoff_cap, self.limits.backoff_base * 2 ** attempt))
+                retry_after = _retry_after(e)
+                if is_rate_limit_error(e):
+                    self.rate_limited += 1
+                    delay = max(delay, retry_after or 0)
+                    await self._penalize(delay)
+                logger.warning(f"{self.name} call failed ({e}); retry {attempt}/{self.limits.max_retries} in {delay:.1f}s")
+            finally:
+                await self._release(correction)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, ProviderScheduler]]" = weakref.WeakKeyDictionary()
+
+def get_scheduler(provider: str) -> ProviderScheduler:
+    # Asyncio primitives are bound to a loop, so each event loop gets its own set of schedulers.
+    loop = asyncio.get_running_loop()
+    schedulers = _schedulers.setdefault(loop, {})
+    if provider not in schedulers:
+        schedulers[provider] = ProviderScheduler(provider, PROVIDER_LIMITS[provider])
+    return schedulers[provider]
+
+_run_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, weakref.WeakValueDictionary[tuple[str, int], asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+def get_run_limiter(run_id: str, limit: int) -> asyncio.Semaphore:
+    """Semaphore capping one run's concurrent calls; it is dropped once no call holds a reference to it."""
+    loop = asyncio.get_running_loop()
+    limiters = _run_limiters.setdefault(loop, weakref.WeakValueDictionary())
+    limiter = limiters.get((run_id, limit))
+    if limiter is None:
+        limiter = asyncio.Semaphore(limit)
+        limiters[(run_id, limit)] = limiter
+    return limiter
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+async def hedged_call(call: Callable[[], Awaitable[T]], *, timeout: float, hedge_after: Optional[float] = None) -> T:
+    """Run ``call`` under a deadline, launching one duplicate attempt if the first is still pending after ``hedge_after`` seconds."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    hedge_at = loop.time() + hedge_after if hedge_after is not None else None
+    tasks = {asyncio.ensure_future(call())}
+    last_error: Optional[BaseException] = None
+    try:
+        while tasks:
+            now = loop.time()
+            if now >= deadline:
+                break
+            wait = deadline - now
+            if hedge_at is not None:
+                wait = min(wait, max(0.0, hedge_at - now))
+            done, tasks = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            if hedge_at is not None and loop.time() >= hedge_at:
+                hedge_at = None
+                if tasks:
+                    logger.info(f"Hedging straggling call after {hedge_after:.1f}s")
+                    tasks.add(asyncio.ensure_future(call()))
+        if last_error is not None and not tasks:
+            raise last_error
+        raise asyncio.TimeoutError(f"Call did not complete within {timeout:.1f}s")
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,88 @@
+import math
+import re
+from typing import Any, Iterable, Optional, TypedDict
+
+from sources import allocate_budget, terms
+
+HIGH_COVERAGE = 0.8
+PARTIAL_COVERAGE = 0.5
+MAX_SCALE = 2
+
+_BREADTH_RE = re.compile(
+    r"\b(compar\w*|versus|vs|trade-?offs?|landscape|ecosystem|history|evolution|trends?|market|benchmarks?|"
+    r"pricing|case stud\w*|challenges|regulat\w*|statistics|adoption|performance|risks?)\b",
+    re.IGNORECASE,
+)
+
+class SearchBudget(TypedDict):
+    queries_per_round: int
+    remaining_queries: int
+    max_depth: int
+    source_tokens: int
+
+def estimate_difficulty(description: str) -> float:
+    """Relative research effort a section needs, from the breadth of its plan description."""
+    enumerations = description.count(",") + description.count(";") + len(re.findall(r"\band\b", description))
+    return 1.0 + 0.05 * len(terms(description)) + 0.15 * enumerations + 0.3 * len(_BREADTH_RE.findall(description))
+
+def allocate_search_budgets(
+    sections: list[Any],
+    number_of_queries: int,
+    max_search_depth: int,
+    source_token_budget: int,
+    search_call_budget: int = 0,
+    report_token_budget: int = 0,
+) -> dict[str, SearchBudget]:
+    """Split one report-wide budget of search calls and source tokens across sections by estimated difficulty.
+
+    Without explicit budgets the totals match the fixed policy (``number_of_queries`` per round for
+    ``max_search_depth`` rounds, ``source_token_budget`` per section). Every section gets at least one
+    query, and none gets more than ``MAX_SCALE`` times its fixed-policy share.
+    """
+    if not sections:
+        return {}
+    count = len(sections)
+    calls = search_call_budget or number_of_queries * max_search_depth * count
+    tokens = report_token_budget or source_token_budget * count
+    weights = [estimate_difficulty(section.description) for section in sections]
+
+    call_cap = MAX_SCALE * number_of_queries * max_search_depth
+    extra_calls = allocate_budget([call_cap - 1] * count, weights, max(calls - count, 0))
+    token_shares = allocate_budget([MAX_SCALE * source_token_budget] * count, weights, tokens)
+
+    budgets = {}
+    for section, extra, source_tokens in zip(sections, extra_calls, token_shares):
+        total = extra + 1
+        queries_per_round = min(max(round(total / max_search_depth), 1), MAX_SCALE * number_of_queries)
+        budgets[section.name] = SearchBudget(
+            queries_per_round=queries_per_round,
+            remaining_queries=total,
+            max_depth=min(math.ceil(total / queries_per_round), MAX_SCALE * max_search_depth),
+            source_tokens=max(source_tokens, 1000),
+        )
+    return budgets
+
+def coverage(description: str, sources: Iterable[dict[str, Any]], sample_chars: int = 4000) -> float:
+    """Share of the description's key terms that appear in the sources' snippets and leading text."""
+    wanted = terms(description)
+    if not wanted:
+        return 1.0
+    found: set[str] = set()
+    for source in sources:
+        found |= terms(f"{source.get('content') or ''} {(source.get('raw_content') or '')[:sample_chars]}")
+    return len(wanted & found) / len(wanted)
+
+def spend(budget: SearchBudget, queries: int, iteration: int, first_round_coverage: Optional[float] = None) -> SearchBudget:
+    """Charge a search round to ``budget``; a well-covered first round forgoes the remaining rounds."""
+    updated = SearchBudget(**{**budget, "remaining_queries": max(budget["remaining_queries"] - queries, 0)})
+    if iteration == 1 and first_round_coverage is not None and first_round_coverage >= HIGH_COVERAGE:
+        updated["max_depth"] = 1
+    return updated
+
+def first_round_queries(query_count: int, prefetched_coverage: float) -> int:
+    """How many first-round queries are still worth running when sources fetched earlier already give this coverage."""
+    if prefetched_coverage >= HIGH_COVERAGE:
+        return 0
+    if prefetched_coverage >= PARTIAL_COVERAGE:
+        return math.ceil(query_count / 2)
+    return query_count
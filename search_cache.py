@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from functools import lru_cache
+from typing import Any, Optional
+
+from sqlite_store import SqliteStore, env_megabytes, env_store_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "search_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class SearchCache(SqliteStore):
+    """Content-addressed SQLite cache for search responses with TTL and size-based LRU eviction."""
+
+    TABLE = "search_cache"
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "key TEXT PRIMARY KEY, provider TEXT NOT NULL, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed_at ON search_cache (accessed_at)")
+
+    @staticmethod
+    def make_key(provider: str, query: str, **params: Any) -> str:
+        payload = json.dumps(
+            {"provider": provider, "query": normalize_query(query), "params": params},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self._count("misses")
+                return None
+            conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return json.loads(value)
+
+    def set(self, key: str, provider: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        data = json.dumps(value).encode("utf-8")
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, provider, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, data, len(data), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute("DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        evicted = max(expired, 0) + self._evict_lru(conn, self.max_bytes)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def clear(self) -> None:
+        if not self.enabled:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM search_cache")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, provider: str, value: Any) -> None:
+        await asyncio.to_thread(self.set, key, provider, value)
+
+@lru_cache(maxsize=1)
+def get_search_cache() -> SearchCache:
+    return SearchCache(
+        path=env_store_path("SEARCH_CACHE", DEFAULT_CACHE_PATH),
+        ttl_seconds=float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+        max_bytes=env_megabytes("SEARCH_CACHE_MAX_MB", DEFAULT_MAX_BYTES),
+    )
@@ -0,0 +1,46 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+import instrumentation
+from local_index import get_local_index
+
+SearchFunction = Callable[..., Awaitable[list[dict[str, Any]]]]
+
+@dataclass(frozen=True)
+class SearchProvider:
+    """A search backend: ``search(queries, priority=..., include_raw_content=..., reuse_stored_pages=...)``
+    returns one Tavily-style result document per query.
+
+    ``include_raw_content`` says whether results carry full page text worth packing into prompts;
+    callers that only need snippets pass ``include_raw_content=False`` so backends can skip page text.
+    ``reuse_stored_pages`` lets backends that fetch page text take it from the source store instead.
+    """
+    name: str
+    search: SearchFunction
+    include_raw_content: bool = True
+
+SEARCH_PROVIDERS: dict[str, SearchProvider] = {}
+
+def register_search_provider(provider: SearchProvider) -> None:
+    SEARCH_PROVIDERS[provider.name] = provider
+
+def get_search_provider(name: str) -> SearchProvider:
+    if name not in SEARCH_PROVIDERS:
+        raise ValueError(f"Unsupported search API: {name}; expected any of {list(SEARCH_PROVIDERS)}")
+    return SEARCH_PROVIDERS[name]
+
+async def local_search(search_queries, priority: Optional[int] = None, include_raw_content: bool = True, reuse_stored_pages: bool = False, max_results: int = 5) -> list[dict[str, Any]]:
+    index = get_local_index()
+
+    async def search_one(query):
+        with instrumentation.span("search.local", query=query.search_query) as search_span:
+            results = await asyncio.to_thread(index.search, query.search_query, max_results)
+            if not include_raw_content:
+                results = [{**result, "raw_content": None} for result in results]
+            search_span.set("results", len(results))
+            return {"query": query.search_query, "follow_up_questions": None, "answer": None, "images": [], "results": results}
+
+    return list(await asyncio.gather(*(search_one(query) for query in search_queries)))
+
+register_search_provider(SearchProvider("local", local_search, include_raw_content=True))
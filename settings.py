@@ -0,0 +1,14 @@
+import os
+from typing import Any
+
+FALSE_STRINGS = frozenset({"", "0", "false", "no", "off"})
+
+def as_bool(value: Any) -> bool:
+    """Read a flag that may arrive as an env string: "0", "false", "no" and "off" are False."""
+    if isinstance(value, str):
+        return value.strip().lower() not in FALSE_STRINGS
+    return bool(value)
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else as_bool(value)
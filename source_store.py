@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+from sources import normalize_url
+from sqlite_store import SqliteStore, env_megabytes, env_store_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.path.join(".cache", "source_store.sqlite3")
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+class SourceStore(SqliteStore):
+    """Compressed SQLite store of fetched page text keyed by normalized URL.
+
+    Pages older than ``max_age_seconds`` are neither returned nor kept, and the least recently used
+    pages are evicted once the compressed total exceeds ``max_bytes``.
+    """
+
+    TABLE = "pages"
+    KEY_COLUMN = "url"
+
+    def __init__(self, path: Optional[str] = DEFAULT_STORE_PATH, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, original_url TEXT NOT NULL, title TEXT, content_hash TEXT NOT NULL, "
+            "body BLOB NOT NULL, size INTEGER NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+
+    def get_many(self, urls: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Stored pages for ``urls``, keyed by the URL as given."""
+        if not self.enabled:
+            return {}
+        keys = {normalize_url(url): url for url in urls}
+        if not keys:
+            return {}
+        now = time.time()
+        pages = {}
+        with closing(self._connect()) as conn, conn:
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT url, title, body, fetched_at FROM pages WHERE url IN ({placeholders}) AND fetched_at >= ?",
+                (*keys, now - self.max_age_seconds),
+            ).fetchall()
+            for key, title, body, fetched_at in rows:
+                pages[keys[key]] = {"title": title, "raw_content": zlib.decompress(body).decode("utf-8"), "fetched_at": fetched_at}
+            conn.executemany("UPDATE pages SET accessed_at = ? WHERE url = ?", [(now, key) for key, *_ in rows])
+        self._count("hits", len(pages))
+        self._count("misses", len(keys) - len(pages))
+        return pages
+
+    def put_many(self, pages: Iterable[dict[str, Any]]) -> int:
+        """Store pages (``url``, ``title``, ``raw_content``), replacing and re-dating any earlier copy."""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        rows = []
+        for page in pages:
+            raw_content = page.get("raw_content")
+            if not raw_content:
+                continue
+            data = raw_content.encode("utf-8")
+            body = zlib.compress(data, 6)
+            rows.append((normalize_url(page["url"]), page["url"], page.get("title"), hashlib.sha256(data).hexdigest(), body, len(body), now, now))
+        if not rows:
+            return 0
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO pages (url, original_url, title, content_hash, body, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET "
+                "fetched_at = excluded.fetched_at, accessed_at = excluded.accessed_at, title = excluded.title, "
+                "original_url = excluded.original_url, content_hash = excluded.content_hash, body = excluded.body, size = excluded.size",
+                rows,
+            )
+            self._evict(conn, now)
+        return len(rows)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute("DELETE FROM pages WHERE fetched_at < ?", (now - self.max_age_seconds,)).rowcount
+        evicted = max(expired, 0) + self._evict_lru(conn, self.max_bytes)
+        if evicted:
+            self._count("evictions", evicted)
+
+    async def aget_many(self, urls: Iterable[str]) -> dict[str, dict[str, Any]]:
+        return await asyncio.to_thread(self.get_many, list(urls))
+
+    async def aput_many(self, pages: Iterable[dict[str, Any]]) -> int:
+        return await asyncio.to_thread(self.put_many, list(pages))
+
+@lru_cache(maxsize=1)
+def get_source_store() -> SourceStore:
+    return SourceStore(
+        path=env_store_path("SOURCE_STORE", DEFAULT_STORE_PATH),
+        max_age_seconds=float(os.environ.get("SOURCE_STORE_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS)),
+        max_bytes=env_megabytes("SOURCE_STORE_MAX_MB", DEFAULT_MAX_BYTES),
+    )
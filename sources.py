@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import re
+import threading
+from typing import Any, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_TOKENS = 160
+SHINGLE_SIZE = 5
+SKETCH_SIZE = 64
+MIN_FINGERPRINT_WORDS = 50
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_TRACKING_PARAMS = frozenset({"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src", "spm", "_ga", "_hsenc", "_hsmi"})
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in into is it its of on or that the their this to was were what when "
+    "which who why will with about over under between than then there these those such can may more most also not".split()
+)
+
+_UNLOADED = object()
+_encoding: Any = _UNLOADED
+_encoding_lock = threading.Lock()
+
+def load_encoding():
+    """tiktoken's encoding, loaded once; ``None`` when it is unavailable and token counts are estimated from characters."""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is _UNLOADED:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # tiktoken downloads its BPE files on first use, which fails offline.
+                logger.warning(f"tiktoken unavailable, estimating tokens from characters: {e}")
+                _encoding = None
+    return _encoding
+
+async def aload_encoding() -> None:
+    """Load the encoding in a worker thread, since the import and first-use download block."""
+    if _encoding is _UNLOADED:
+        await asyncio.to_thread(load_encoding)
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+def _current_encoding():
+    encoding = _encoding
+    if encoding is _UNLOADED:
+        # Never block a running event loop on the load; estimate until aload_encoding has finished.
+        encoding = None if _in_event_loop() else load_encoding()
+    return encoding
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _current_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def token_windows(text: str, max_tokens: int) -> list[str]:
+    """``text`` cut into consecutive pieces of at most ``max_tokens`` tokens, regardless of its punctuation."""
+    if not text or max_tokens <= 0:
+        return []
+    encoding = _current_encoding()
+    if encoding is None:
+        # Matches count_tokens' estimate, which adds one token to every piece; cuts fall on whitespace where there is some.
+        size = max(max_tokens - 1, 1) * 4
+        windows = []
+        start = 0
+        while start < len(text):
+            end = start + size
+            if end < len(text):
+                space = text.rfind(" ", start + size // 2, end)
+                end = space + 1 if space >= 0 else end
+            windows.append(text[start:end].strip())
+            start = end
+        return [window for window in windows if window]
+    ids = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(ids[start:start + max_tokens]) for start in range(0, len(ids), max_tokens)]
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    windows = token_windows(text, max_tokens)
+    return windows[0] if windows else ""
+
+def tokens(text: str) -> list[str]:
+    return [word for word in _WORD_RE.findall(text.lower()) if len(word) > 2 and word not in _STOPWORDS]
+
+def terms(text: str) -> set[str]:
+    return set(tokens(text))
+
+def normalize_url(url: str) -> str:
+    """Canonical form of ``url`` for deduplication: scheme, ``www.``, default ports, fragments and tracking parameters are ignored."""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+def fingerprint(text: str) -> Optional[frozenset[int]]:
+    """Bottom-k MinHash sketch of the word shingles of ``text``, or None when the text is too short to compare."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < MIN_FINGERPRINT_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big") for shingle in shingles)
+    return frozenset(heapq.nsmallest(SKETCH_SIZE, hashes))
+
+def similarity(a: frozenset[int], b: frozenset[int]) -> float:
+    """Estimated Jaccard similarity of two bottom-k sketches."""
+    union_sketch = heapq.nsmallest(SKETCH_SIZE, a | b)
+    if not union_sketch:
+        return 0.0
+    return sum(1 for h in union_sketch if h in a and h in b) / len(union_sketch)
+
+def deduplicate_sources(sources: Iterable[dict[str, Any]], known: Iterable[dict[str, Any]] = ()) -> list[dict[str, Any]]:
+    """Drop sources whose normalized URL or body duplicates a higher-scoring or ``known`` source, keeping first-seen order."""
+    known = list(known)
+    known_urls = {normalize_url(source['url']) for source in known}
+    by_url: dict[str, tuple[int, dict[str, Any]]] = {}
+    for position, source in enumerate(sources):
+        key = normalize_url(source['url'])
+        if key in known_urls:
+            continue
+        current = by_url.get(key)
+        if current is None:
+            by_url[key] = (position, source)
+        elif (source.get('score') or 0) > (current[1].get('score') or 0):
+            by_url[key] = (current[0], source)
+
+    ranked = sorted(by_url.values(), key=lambda item: (-(item[1].get('score') or 0), item[0]))
+    kept: list[tuple[int, dict[str, Any]]] = []
+    sketches: list[frozenset[int]] = [frozenset(source['fingerprint']) for source in known if source.get('fingerprint')]
+    for position, source in ranked:
+        sketch = fingerprint(source.get('raw_content') or source.get('content') or '')
+        if sketch is not None:
+            if any(similarity(sketch, other) >= NEAR_DUPLICATE_THRESHOLD for other in sketches):
+                logger.info(f"Dropping near-duplicate source: {source['url']}")
+                continue
+            sketches.append(sketch)
+        kept.append((position, source))
+    kept.sort(key=lambda item: item[0])
+    return [source for _, source in kept]
+
+def index_source(source: dict[str, Any], iteration: int) -> dict[str, Any]:
+    """Compact record of a source for the per-section index: everything but ``raw_content``, plus its fingerprint."""
+    sketch = fingerprint(source.get('raw_content') or source.get('content') or '')
+    return {
+        "url": source['url'],
+        "title": source.get('title'),
+        "content": source.get('content'),
+        "score": source.get('score'),
+        "query": source.get('query'),
+        "iteration": iteration,
+        "fingerprint": sorted(sketch) if sketch else None,
+    }
+
+def format_earlier_sources(known: Iterable[dict[str, Any]], query: str, token_budget: int) -> str:
+    """Summaries of previously used sources, most relevant to ``query`` first, within ``token_budget`` tokens."""
+    query_terms = terms(query)
+    ranked = sorted(
+        known,
+        key=lambda source: (len(query_terms & terms(source.get('content') or '')), source.get('score') or 0),
+        reverse=True,
+    )
+    parts = []
+    used = 0
+    for source in ranked:
+        entry = f"Source {source['title']}:\n===\nURL: {source['url']}\n===\nMost relevant content from source: {source['content']}\n===\n"
+        entry_tokens = count_tokens(entry)
+        if used + entry_tokens > token_budget:
+            continue
+        parts.append(entry)
+        used += entry_tokens
+    if not parts:
+        return ""
+    return "Previously reviewed sources (already reflected in the existing section content):\n\n" + "".join(parts).strip()
+
+def _fit_pieces(pieces: list[str], max_tokens: int) -> Iterable[str]:
+    # Sentences, or text with no sentence breaks at all, that are longer than a passage are cut into windows.
+    for piece in pieces:
+        if count_tokens(piece) <= max_tokens:
+            yield piece
+        else:
+            yield from token_windows(piece, max_tokens)
+
+def split_passages(text: str, max_tokens: int = PASSAGE_TOKENS) -> list[str]:
+    passages: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for paragraph in (p.strip() for p in re.split(r"\n\s*\n|\n", text)):
+        if not paragraph:
+            continue
+        pieces = [paragraph] if count_tokens(paragraph) <= max_tokens else _SENTENCE_RE.split(paragraph)
+        for piece in _fit_pieces(pieces, max_tokens):
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                passages.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+def select_passages(text: str, query_terms: set[str], budget: int) -> tuple[str, bool]:
+    """Keep the passages of ``text`` that best match ``query_terms`` within ``budget`` tokens, in document order."""
+    if count_tokens(text) <= budget:
+        return text, False
+    passages = split_passages(text)
+    scored = []
+    for position, passage in enumerate(passages):
+        passage_terms = terms(passage)
+        overlap = len(query_terms & passage_terms)
+        # Lead passages break ties so that, absent any signal, the packer degrades to a prefix.
+        scored.append((overlap / math.sqrt(len(passage_terms) + 1), -position, position, passage))
+    scored.sort(reverse=True)
+
+    chosen: list[tuple[int, str]] = []
+    used = 0
+    for _, _, position, passage in scored:
+        passage_tokens = count_tokens(passage)
+        if used + passage_tokens > budget:
+            continue
+        chosen.append((position, passage))
+        used += passage_tokens
+    if not chosen:
+        # Not even one passage fits: keep the start of the source rather than nothing.
+        prefix = truncate_tokens(text, budget - count_tokens("\n... [truncated]"))
+        return f"{prefix}\n... [truncated]" if prefix else "... [truncated]", True
+    chosen.sort()
+
+    parts = []
+    previous = -1
+    for position, passage in chosen:
+        if position != previous + 1:
+            parts.append("...")
+        parts.append(passage)
+        previous = position
+    if previous != len(passages) - 1:
+        parts.append("... [truncated]")
+    return "\n".join(parts), True
+
+def allocate_budget(demands: list[int], weights: list[float], budget: int) -> list[int]:
+    """Split ``budget`` across sources in proportion to ``weights``, never giving a source more than it ``demands``."""
+    allocation = [0] * len(demands)
+    active = [i for i, demand in enumerate(demands) if demand > 0]
+    remaining = budget
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active)
+        shares = {i: int(remaining * weights[i] / total_weight) for i in active}
+        satisfied = [i for i in active if shares[i] >= demands[i]]
+        if not satisfied:
+            for i in active:
+                allocation[i] = shares[i]
+            break
+        for i in satisfied:
+            allocation[i] = demands[i]
+            remaining -= demands[i]
+            active.remove(i)
+    return allocation
+
+def pack_sources(
+    sources: list[dict[str, Any]],
+    max_tokens_per_source: int,
+    include_raw_content: bool = True,
+    token_budget: Optional[int] = None,
+    query: Optional[str] = None,
+) -> str:
+    headers = []
+    for source in sources:
+        headers.append(
+            f"Source {source['title']}:\n===\n"
+            f"URL: {source['url']}\n===\n"
+            f"Most relevant content from source: {source['content']}\n===\n"
+        )
+    if not include_raw_content:
+        return ("Sources:\n\n" + "".join(headers)).strip()
+
+    raw_contents = []
+    for source in sources:
+        raw_content = source.get('raw_content')
+        if raw_content is None:
+            logger.warning(f"No raw_content found for source: {source['url']}")
+            raw_content = ''
+        raw_contents.append(raw_content)
+
+    demands = [min(count_tokens(raw_content), max_tokens_per_source) for raw_content in raw_contents]
+    if token_budget is None:
+        budgets = demands
+    else:
+        available = max(token_budget - sum(count_tokens(header) for header in headers), 0)
+        weights = [max(float(source.get('score') or 0.0), 0.05) for source in sources]
+        budgets = allocate_budget(demands, weights, available)
+
+    parts = ["Sources:\n\n"]
+    for source, header, raw_content, budget in zip(sources, headers, raw_contents, budgets):
+        query_terms = terms(" ".join(filter(None, [query, source.get('query')])))
+        packed, _ = select_passages(raw_content, query_terms, budget)
+        parts.append(header)
+        parts.append(f"Full source content limited to {budget} tokens: {packed}\n\n")
+    return "".join(parts).strip()
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Optional
+
+from settings import env_flag
+
+class SqliteStore:
+    """Base for the local SQLite caches and stores.
+
+    Every operation opens its own connection to a WAL-mode file, so several threads, event loops
+    or worker processes can share it. Subclasses create their schema in ``_create_schema``, count
+    lookups with ``_count`` and bound their table with ``_evict_lru``. A store without a ``path``
+    is disabled.
+    """
+
+    TABLE = ""
+    KEY_COLUMN = "key"
+    COUNTERS: tuple[str, ...] = ("hits", "misses", "evictions")
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self._stats_lock = threading.Lock()
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                self._create_schema(conn)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        pass
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _evict_lru(self, conn: sqlite3.Connection, max_bytes: int) -> int:
+        """Delete least recently accessed rows until the table's ``size`` column sums to at most ``max_bytes``."""
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        stale_keys = []
+        for key, size in conn.execute(f"SELECT {self.KEY_COLUMN}, size FROM {self.TABLE} ORDER BY accessed_at ASC"):
+            if total <= max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        conn.executemany(f"DELETE FROM {self.TABLE} WHERE {self.KEY_COLUMN} = ?", stale_keys)
+        return len(stale_keys)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+def env_store_path(prefix: str, default_path: str) -> Optional[str]:
+    """Store file from ``<prefix>_PATH``; ``None``, which disables the store, when ``<prefix>_DISABLED`` is set."""
+    if env_flag(f"{prefix}_DISABLED"):
+        return None
+    return os.environ.get(f"{prefix}_PATH", default_path)
+
+def env_megabytes(name: str, default_bytes: int) -> int:
+    return int(float(os.environ.get(name, default_bytes / (1024 * 1024))) * 1024 * 1024)